@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 import sys
-import pdfrog
+from pdfrog.application import Application
 
 if __name__ == "__main__":
     if sys.version_info < (3, 0):
         reload(sys)
         sys.setdefaultencoding('utf-8')
-    w = pdfrog.pdfrog()
-    w.run()
+    w = Application()
+    w.run(sys.argv[1] if len(sys.argv) > 1 else None)
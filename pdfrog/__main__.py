@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/__main__.py
+import sys
+from pdfrog.cli import main
+
+sys.exit(main())
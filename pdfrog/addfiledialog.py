@@ -2,7 +2,7 @@
 # file: pdfrog/addfiledialog.py
 from PySide.QtGui import *
 from PySide.QtCore import *
-from pdfrog.datamodel import Article
+from pdfrog.datamodel import Article, FileBlob
 import pdfrog
 import hashlib
 import mimetypes
@@ -57,9 +57,11 @@ class AddFileDialog(QDialog):
     def doAddFile(self):
         article = Article()
         mime = mimetypes.guess_type(self.file_name.text())
+        md5 = hashlib.md5()
         with open(self.file_name.text(), 'rb') as f:
-            article.fileblob = f.read()
-        article.md5 = hashlib.md5(article.fileblob).hexdigest()
+            article.blob = FileBlob.fromFile(f, [md5])
+        article.md5 = md5.hexdigest()
+        article.filesize = article.blob.size
         article.title = self.article_title.text()
         article.filemime = mime[0]
         article.filecompr = mime[1]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/application.py
+import sys
+from PySide.QtCore import *
+from PySide.QtGui import *
+import pdfrog
+from pdfrog.mainwnd import MainWnd
+from pdfrog import database
+
+class Application:
+    def __init__(self):
+        pass
+
+    def run(self, path=None):
+        """shows library at path, database.DEFAULT_PATH by default"""
+        self.engine = database.connect(path or database.DEFAULT_PATH)
+        pdfrog.session.commit()
+
+        app = QApplication(sys.argv)
+        QTextCodec.setCodecForCStrings (QTextCodec.codecForName("UTF-8"))
+
+        mainwnd = MainWnd()
+        mainwnd.show()
+        sys.exit(app.exec_())
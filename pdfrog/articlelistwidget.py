@@ -2,11 +2,14 @@
 # file: pdfrog/articlelistwidget.py
 from PySide.QtGui import *
 from PySide.QtCore import *
-from pdfrog.datamodel import Article
+from pdfrog.datamodel import Article, Tag
 from pdfrog.editarticledialog import EditArticleDialog
+from pdfrog.pagedmodel import PagedQueryModel
 import pdfrog
 
 class ArticleList(QTableView):
+    articlesDeleted = Signal(int)
+
     def __init__(self, *args):
         QTableView.__init__(self, *args)
         mdl = ArticleListModel(self)
@@ -16,18 +19,21 @@ class ArticleList(QTableView):
         self.horizontalHeader().setHighlightSections(False)
         self.installEventFilter(self)
         self.setAcceptDrops(True)
+        # no column is sorted until user clicks its header
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.setSortingEnabled(True)
         self.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         # connect signals
         self.horizontalHeader().sectionResized.connect(self.__handle_headerSectionResized)
+        mdl.rowsInserted.connect(self.__handle_rowsInserted)
+        mdl.dataChanged.connect(self.__handle_dataChanged)
         self.activated.connect(self.handle_activated)
         # make scrolling smoother
         self.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
         self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
-        # fill list with initial data
+        # list is filled by main window when its tab is first shown
         self.query = None
-        self.refreshData()
 
     def createMenu(self, article_menu):
         article_edit_title_action = QAction('Edit title', self)
@@ -68,6 +74,15 @@ class ArticleList(QTableView):
     def __handle_headerSectionResized(self, idx, oldsize, newsize):
         self.resizeRowsToContents()
 
+    def __handle_rowsInserted(self, parent, first, last):
+        for row in range(first, last + 1):
+            self.resizeRowToContents(row)
+
+    def __handle_dataChanged(self, top_left, bottom_right):
+        # rows are inserted empty, their page is loaded in background
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.resizeRowToContents(row)
+
     def deleteSelectedArticles(self):
         """deletes selected articles from database"""
         selected_rows = self.selectionModel().selectedRows()
@@ -78,16 +93,18 @@ class ArticleList(QTableView):
         mb.addButton(QMessageBox.Yes)
         mb.addButton(QMessageBox.No)
         mb.setWindowTitle('Delete')
+        titles = ['"'+(self.model().data(idx) or '')+'"' for idx in selected_rows[:20]]
+        if len(selected_rows) > 20:
+            titles.append('and {} more'.format(len(selected_rows) - 20))
         text = 'Do you want to remove these articles from database:\n\n' + \
-            ',\n'.join(['"'+self.model().data(idx)+'"' for idx in selected_rows]) + \
-            ' ?\n'
+            ',\n'.join(titles) + ' ?\n'
         mb.setText(text)
         res = mb.exec_()
         if QMessageBox.Yes == res:
-            article_list = [self.model().item(idx.row()) for idx in selected_rows];
-            for a in article_list:
-                self.model().deleteArticleByObject(a)
-                pdfrog.session.delete(a)
+            rows = [idx.row() for idx in selected_rows]
+            Article.deleteMany([self.item(row).id for row in rows])
+            self.model().removeItemRows(rows)
+            self.articlesDeleted.emit(len(rows))
 
     def eventFilter(self, obj, event):
         if event.type() == QEvent.ContextMenu:
@@ -124,12 +141,7 @@ class ArticleList(QTableView):
         if len(idxs) != 0:    # something selected
             ead = EditArticleDialog(self, self.item(idxs[0].row()))
             ead.exec_()
-            self.dataChanged(idxs[0], idxs[0])
-
-    def appendArticle(self, obj):
-        if type(obj) is not Article:
-            raise Exception("is not Article")
-        self.model().appendArticle(obj)
+            self.model().rowsChanged([idxs[0].row()])
 
     def removeAllArticles(self):
         self.model().clearData()
@@ -142,37 +154,37 @@ class ArticleList(QTableView):
         if len(idxs) == 0: return
         (tag_name, ok_pressed) = QInputDialog.getText(self, "Add tag", "Tag:")
         if ok_pressed and tag_name != '':
-            for idx in idxs:
-                self.item(idx.row()).addTagByName(tag_name)
-                self.dataChanged(idx, idx)
+            tag = Tag.byName(tag_name, create=True)
+            tag.addToArticles([self.item(idx.row()).id for idx in idxs])
+            self.model().rowsChanged([idx.row() for idx in idxs])
 
     def removeTagFromSelectedArticles(self):
         idxs = self.selectionModel().selectedRows()
         if len(idxs) == 0: return
         (tag_name, ok_pressed) = QInputDialog.getText(self, "Remove tag", "Tag:")
         if ok_pressed and tag_name != '':
-            for idx in idxs:
-                self.item(idx.row()).removeTagByName(tag_name)
-                self.dataChanged(idx, idx)
+            tag = Tag.byName(tag_name)
+            if tag is None: return
+            tag.removeFromArticles([self.item(idx.row()).id for idx in idxs])
+            self.model().rowsChanged([idx.row() for idx in idxs])
 
-    def refreshData(self, query=None):
+    def refreshData(self, query=None, total=None, first_page=None):
         if query is None:
-            query = self.query or pdfrog.session.query(Article).limit(300)
+            query = self.query or pdfrog.session.query(Article)
         self.query = query
-        mdl = self.model()
-        mdl.clearData()
-        item_count = 0
-        for article in query:
-            mdl.appendArticle(article)
-            item_count += 1
-        self.resizeRowsToContents()
-        return item_count
+        # model drops sort keys, results come in query's own order
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        return self.model().setQuery(query, total, first_page)
+
+    def clearData(self):
+        """forgets query and shown rows, e.g. when another library is opened"""
+        self.query = None
+        self.model().clearData()
 
 
-class ArticleListModel(QAbstractTableModel):
-    def __init__(self, parent=None, *args):
-        QAbstractTableModel.__init__(self, parent, *args)
-        self.datastore = []
+class ArticleListModel(PagedQueryModel):
+    def __init__(self, parent=None):
+        PagedQueryModel.__init__(self, Article.id, parent)
         self.view = parent
 
     COLUMN_TITLE = 0
@@ -181,45 +193,39 @@ class ArticleListModel(QAbstractTableModel):
     COLUMN_AUTHORS = 3
     COLUMN_TAGS = 4
 
-    def rowCount(self, parent = None):
-        return len(self.datastore)
-
     def columnCount(self, parent = None):
         return 5
 
     def data(self, index, role = Qt.DisplayRole):
         if not index.isValid():
             return None
+        article = self.shownItem(index.row())
+        if article is None:
+            return None
         elif role == Qt.DisplayRole:
             if index.column() == self.COLUMN_TITLE:
-                return self.datastore[index.row()].title
+                return article.title
             elif index.column() == self.COLUMN_MD5:
-                return self.datastore[index.row()].md5
+                return article.md5
             elif index.column() == self.COLUMN_MIME:
-                mime = self.datastore[index.row()].filemime
-                compr = self.datastore[index.row()].filecompr
+                mime = article.filemime
+                compr = article.filecompr
                 if compr is not None: mime += " ("+compr+")"
                 return mime
             elif index.column() == self.COLUMN_AUTHORS:
-                article = self.datastore[index.row()]
-                author_string = ", ".join(author.name \
-                  for author in article.authors[0:3] if author.name is not None)
-                if len(article.authors) > 3:
-                    author_string += ", et. al."
-                return author_string
+                return article.author_names or ''
             elif index.column() == self.COLUMN_TAGS:
-                article = self.datastore[index.row()]
-                tag_string = ", ".join(tag.name for tag in article.tags)
-                return tag_string
+                return article.tag_names or ''
             else:
                 return "Unknown"
         elif role == Qt.EditRole:
-            return self.datastore[index.row()].title
+            return article.title
         return None
 
     def setData(self, index, value, role):
         if role == Qt.EditRole:
-            self.datastore[index.row()].title = value
+            self.item(index.row()).title = value
+            self.dataChanged.emit(index, index)
             return True
         return False
 
@@ -233,19 +239,16 @@ class ArticleListModel(QAbstractTableModel):
         return flags
 
     def sort(self, column, order):
-        self.layoutAboutToBeChanged.emit()
-        if column == self.COLUMN_TITLE:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.title, reverse=(order == Qt.DescendingOrder))
-        elif column == self.COLUMN_MD5:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.md5, reverse=(order == Qt.DescendingOrder))
-        elif column == self.COLUMN_MIME:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.filemime, reverse=(order == Qt.DescendingOrder))
-        elif column == self.COLUMN_AUTHORS:
-            # TODO: should I sort by authors?
-            pass # do nothing
-        elif column == self.COLUMN_TAGS:
-            pass
-        self.layoutChanged.emit()
+        columns = {
+            self.COLUMN_TITLE: Article.title,
+            self.COLUMN_MD5: Article.md5,
+            self.COLUMN_MIME: Article.filemime,
+            self.COLUMN_AUTHORS: Article.author_names,
+            self.COLUMN_TAGS: Article.tag_names,
+        }
+        if column not in columns:
+            return
+        self.sortQuery([(columns[column], order == Qt.DescendingOrder)])
 
     def headerData(self, column, orientation, role):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
@@ -258,22 +261,3 @@ class ArticleListModel(QAbstractTableModel):
                 return "Unnamed column"
         else:
             return None
-
-    def appendArticle(self, obj):
-        row = self.rowCount()
-        self.beginInsertRows(QModelIndex(), row, row)
-        self.datastore.append(obj)
-        self.endInsertRows()
-
-    def deleteArticleByObject(self, obj):
-        row = self.datastore.index(obj)
-        self.beginRemoveRows(QModelIndex(), row, row)
-        self.datastore.remove(obj)
-        self.endRemoveRows()
-
-    def clearData(self):
-        self.modelReset.emit()
-        self.datastore = []
-
-    def item(self, row):
-        return self.datastore[row]
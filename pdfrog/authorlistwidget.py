@@ -4,8 +4,10 @@
 from PySide.QtGui import *
 from PySide.QtCore import *
 import pdfrog
-from .datamodel import Author
+import sqlalchemy as sa
+from .datamodel import Author, Tag, author_article_tags
 from .authoreditdialog import AuthorEditDialog
+from .pagedmodel import PagedQueryModel
 
 class AuthorList(QTableView):
     def __init__(self, parent=None, *args):
@@ -16,11 +18,12 @@ class AuthorList(QTableView):
         self.horizontalHeader().setMovable(True)
         self.horizontalHeader().setHighlightSections(False)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # no column is sorted until user clicks its header
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.setSortingEnabled(True)
         self.installEventFilter(self)
 
         self.query = None
-        self.refreshData()
 
     def createMenu(self, author_menu):
         author_find_articles_action = QAction(QIcon.fromTheme("edit-find"), \
@@ -54,17 +57,18 @@ class AuthorList(QTableView):
     def item(self, row):
         return self.model().item(row)
 
-    def refreshData(self, query=None):
+    def refreshData(self, query=None, total=None, first_page=None):
         if query is None:
-            query = self.query or pdfrog.session.query(Author).limit(300)
+            query = self.query or pdfrog.session.query(Author)
         self.query = query
-        mdl = self.model()
-        mdl.clearData()
-        item_count = 0
-        for author in query:
-            mdl.appendAuthor(author)
-            item_count += 1
-        return item_count
+        # model drops sort keys, results come in query's own order
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        return self.model().setQuery(query, total, first_page)
+
+    def clearData(self):
+        """forgets query and shown rows, e.g. when another library is opened"""
+        self.query = None
+        self.model().clearData()
 
     def eventFilter(self, obj, event):
         if event.type() == QEvent.ContextMenu:
@@ -103,10 +107,17 @@ class AuthorList(QTableView):
 
             self.refreshData()
 
-class AuthorListModel(QAbstractTableModel):
-    def __init__(self, parent=None, *args):
-        QAbstractTableModel.__init__(self, parent, *args)
-        self.datastore = []
+def articleTagNamesKey():
+    """sort key: names of tags of author's articles, as shown in the list"""
+    names = sa.select([Tag.name]).where(Tag.id == author_article_tags.c.tag_id).\
+        where(author_article_tags.c.author_id == Author.id).\
+        order_by(Tag.name).correlate(Author).alias()
+    return sa.select([sa.func.group_concat(names.c.name, ', ')]).as_scalar()
+
+class AuthorListModel(PagedQueryModel):
+    def __init__(self, parent=None):
+        PagedQueryModel.__init__(self, Author.id, parent)
+        self.tag_names = {}
         self.view = parent
 
     COLUMN_NAME = 0
@@ -114,9 +125,6 @@ class AuthorListModel(QAbstractTableModel):
     COLUMN_ARTICLE_COUNT = 2
     COLUMN_ARTICLE_TAGS = 3
 
-    def rowCount(self, parent=None):
-        return len(self.datastore)
-
     def columnCount(self, parent=None):
         return 4
 
@@ -124,16 +132,17 @@ class AuthorListModel(QAbstractTableModel):
         if not index.isValid(): return None
 
         if role == Qt.DisplayRole:
+            author = self.shownItem(index.row())
+            if author is None: return None
             column = index.column()
             if column == self.COLUMN_NAME:
-                return self.datastore[index.row()].name
+                return author.name
             elif column == self.COLUMN_ORGANIZATION:
-                return self.datastore[index.row()].organization
+                return author.organization
             elif column == self.COLUMN_ARTICLE_COUNT:
-                return self.datastore[index.row()].getArticleCount()
+                return author.getArticleCount()
             elif column == self.COLUMN_ARTICLE_TAGS:
-                tag_names = [tag.name for tag in self.datastore[index.row()].getArticleTags()]
-                return ", ".join(tag_names)
+                return self.tag_names.get(author.id, "")
             else:
                 return "unknown"
         else:
@@ -150,34 +159,28 @@ class AuthorListModel(QAbstractTableModel):
                     return "Unknown"
         return None
 
-    def appendAuthor(self, author):
-        self.beginInsertRows(QModelIndex(), len(self.datastore), len(self.datastore))
-        self.datastore.append(author)
-        self.endInsertRows()
+    def setQuery(self, query, total=None, first_page=None):
+        self.tag_names = {}
+        return PagedQueryModel.setQuery(self, query, total, first_page)
 
-    def clearData(self):
-        self.modelReset.emit()
-        self.datastore = []
+    def fetchExtra(self, authors):
+        """article tag names of page of authors"""
+        return Author.articleTagNames([author.id for author in authors])
 
-    def sort(self, column, order):
-        def tags_sort_key(obj):
-            return ", ".join([tag.name for tag in obj.getArticleTags()])
-        def name_sort_key(obj):
-            return obj.name if obj.name is not None else ""
-        def organization_sort_key(obj):
-            return obj.organization if obj.organization is not None else ""
-
-        reverse = (order == Qt.DescendingOrder)
-        self.layoutAboutToBeChanged.emit()
-        if column == self.COLUMN_NAME:
-            self.datastore = sorted(self.datastore, key=name_sort_key, reverse=reverse)
-        elif column == self.COLUMN_ORGANIZATION:
-            self.datastore = sorted(self.datastore, key=organization_sort_key, reverse=reverse)
-        elif column == self.COLUMN_ARTICLE_COUNT:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.getArticleCount(), reverse=reverse)
-        elif column == self.COLUMN_ARTICLE_TAGS:
-            self.datastore = sorted(self.datastore, key=tags_sort_key, reverse=reverse)
-        self.layoutChanged.emit()
+    def addExtra(self, names):
+        for (author_id, tag_names) in names.items():
+            self.tag_names[author_id] = ", ".join(tag_names)
 
-    def item(self, row):
-        return self.datastore[row]
+    def sort(self, column, order):
+        columns = {
+            self.COLUMN_NAME: Author.name,
+            self.COLUMN_ORGANIZATION: Author.organization,
+            self.COLUMN_ARTICLE_COUNT: Author.article_count,
+        }
+        if column == self.COLUMN_ARTICLE_TAGS:
+            key = articleTagNamesKey()
+        elif column in columns:
+            key = columns[column]
+        else:
+            return
+        self.sortQuery([(key, order == Qt.DescendingOrder)])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/autosave.py
+# Commits pdfrog.session a little at a time while user works, so a crash
+# loses at most a few seconds of edits and closing window has little left
+# to write. Session must be created with expire_on_commit=False (see
+# database.py), otherwise every commit would make all shown rows reload.
+# When database is locked by another process, changes stay pending and
+# saving is retried every second.
+import time
+from PySide.QtCore import *
+import sqlalchemy as sa
+import pdfrog
+from pdfrog import config
+from pdfrog import database
+
+class AutoSave(QObject):
+    """commits changes once they are interval seconds old or max_pending
+    objects are changed, whichever comes first"""
+    stateChanged = Signal(bool)     # True when there are uncommitted changes
+    saved = Signal()
+    failed = Signal(str)            # changes are kept, save will be retried
+    lost = Signal(str)              # changes were rolled back
+
+    def __init__(self, parent=None, interval=None, max_pending=None):
+        QObject.__init__(self, parent)
+        self.interval = interval or config.getint('autosave', 'interval')
+        self.max_pending = max_pending or config.getint('autosave', 'max_pending')
+        self.dirty = False
+        self.dirty_since = None
+        self.error = None           # why last save failed
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.check)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def check(self):
+        """notes state of session, saves it when it's time to"""
+        session = pdfrog.session
+        self.setDirty(database.hasUncommittedChanges(session))
+        if not self.dirty: return
+        pending = len(session.new) + len(session.dirty) + len(session.deleted)
+        if pending >= self.max_pending or time.time() - self.dirty_since >= self.interval:
+            self.save()
+
+    def setDirty(self, dirty):
+        if dirty and self.dirty_since is None:
+            self.dirty_since = time.time()
+        elif not dirty:
+            self.dirty_since = None
+        if dirty != self.dirty:
+            self.dirty = dirty
+            self.stateChanged.emit(dirty)
+
+    def save(self):
+        """commits now. Returns False if it failed
+
+        Changes are kept if database was locked, so save can be retried;
+        self.dirty is False if they had to be rolled back."""
+        session = pdfrog.session
+        try:
+            database.lockForWriting(session)
+        except sa.exc.OperationalError as e:
+            self.error = str(e.orig)
+            self.failed.emit(self.error)
+            return False
+        try:
+            session.commit()
+        except sa.exc.OperationalError as e:
+            # failed flush or commit leaves session unusable until rollback
+            session.rollback()
+            self.error = str(e.orig)
+            self.setDirty(False)
+            self.lost.emit(self.error)
+            return False
+        self.error = None
+        self.setDirty(False)
+        self.saved.emit()
+        return True
+
+    def discard(self):
+        """rolls back changes not saved yet"""
+        pdfrog.session.rollback()
+        self.setDirty(False)
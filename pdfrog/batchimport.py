@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/batchimport.py
+# Imports many files at once without asking anything. Files are read,
+# hashed and compressed on a thread pool (zlib, lzma and hashlib let other
+# threads run meanwhile), each of them once; calling thread only writes
+# rows, committing articles in batches. Only a few files are packed ahead
+# of it, so waiting packed data doesn't pile up.
+from multiprocessing.pool import ThreadPool
+import collections
+import hashlib
+import itertools
+import mimetypes
+import os
+import pdfrog
+from pdfrog.datamodel import Article, FileBlob, PackedFile, Tag
+from pdfrog import config
+
+def titleFromFileName(path):
+    """makes article title from file name: no directory, extensions or underscores"""
+    title = os.path.basename(path)
+    (base, ext) = os.path.splitext(title)
+    if ext in mimetypes.encodings_map:
+        (base, ext) = os.path.splitext(base)
+    if ext in mimetypes.types_map:
+        title = base
+    return title.replace('_', ' ').strip()
+
+def _packFile(path):
+    """returns (path, PackedFile, md5) or (path, None, error message)"""
+    try:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            packed = PackedFile(f, [md5])
+        return (path, packed, md5.hexdigest())
+    except (IOError, OSError) as e:
+        return (path, None, str(e))
+
+
+class BatchImport(object):
+    """adds an article for every file in paths"""
+    def __init__(self, paths, threads=None, batch_size=None, tag_name='new'):
+        self.paths = list(paths)
+        self.threads = threads or config.getint('import', 'threads')
+        self.batch_size = batch_size or config.getint('import', 'batch_size')
+        self.tag_name = tag_name
+        self.imported = 0       # articles added
+        self.linked = 0         # of them, ones which got already stored file
+        self.failed = []        # (path, error message)
+
+    def run(self, progress=None):
+        """imports files, calling progress(done, total, path) after each one
+
+        If progress returns False, import stops; articles added so far
+        are kept. Returns number of articles added."""
+        session = pdfrog.session
+        tag = None
+        if self.tag_name:
+            tag = session.query(Tag).filter(Tag.name == self.tag_name).first()
+            if tag is None:
+                tag = Tag()
+                tag.name = self.tag_name
+                session.add(tag)
+        pool = ThreadPool(self.threads)
+        paths = iter(self.paths)
+        # results of files being packed, in order; packed files left there
+        # when import stops are closed once garbage collected
+        pending = collections.deque(pool.apply_async(_packFile, (path,))
+            for path in itertools.islice(paths, 2 * self.threads))
+        try:
+            done = 0
+            while pending:
+                (path, packed, md5) = pending.popleft().get()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append(pool.apply_async(_packFile, (next_path,)))
+                if packed is None:
+                    self.failed.append((path, md5))
+                else:
+                    try:
+                        self._addArticle(path, packed, md5, tag)
+                    except (IOError, OSError) as e:
+                        self.failed.append((path, str(e)))
+                    finally:
+                        packed.close()
+                done += 1
+                if done % self.batch_size == 0:
+                    session.commit()
+                if progress is not None and progress(done, len(self.paths), path) is False:
+                    break
+            session.commit()
+        finally:
+            pool.terminate()
+        return self.imported
+
+    def _addArticle(self, path, packed, md5, tag):
+        article = Article()
+        blob = FileBlob.byDigest(packed.digest)
+        if blob is None:
+            blob = FileBlob.fromPacked(packed)
+        else:
+            self.linked += 1
+        (mime, compr) = mimetypes.guess_type(path)
+        article.blob = blob
+        article.md5 = md5
+        article.filesize = blob.size
+        article.title = titleFromFileName(path)
+        article.filemime = mime
+        article.filecompr = compr
+        if tag is not None:
+            article.tags.append(tag)
+        pdfrog.session.add(article)
+        self.imported += 1
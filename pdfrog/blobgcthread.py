@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/blobgcthread.py
+from PySide.QtCore import *
+from pdfrog import database
+from pdfrog.datamodel import FileBlob
+
+class BlobGarbageCollectThread(QThread):
+    """removes blobs no article refers to, using its own session
+
+    Only sees committed data, so start it after commit."""
+    def run(self):
+        with database.unitOfWork() as session:
+            FileBlob.collectGarbage(session)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/cli.py
+# Command line tool for bulk work, needs no Qt or display:
+#   python -m pdfrog [--db FILE] import|export|search|stats|verify|extract|gc|bench|...
+import argparse
+import hashlib
+import os
+import sys
+import sqlalchemy as sa
+import pdfrog
+from pdfrog import database
+from pdfrog import storage
+from pdfrog import searchquery
+from pdfrog import textextract
+from pdfrog.batchimport import BatchImport
+from pdfrog.datamodel import Article, Author, Tag, FileBlob, FileBlobChunk, \
+    rebuildCounters, rebuildNames
+
+def out(line):
+    """writes line to stdout at once, so output can be piped while running"""
+    if sys.version_info < (3, 0) and isinstance(line, unicode):
+        line = line.encode('utf-8')
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+def _listFiles(paths, recursive):
+    for path in paths:
+        if os.path.isdir(path):
+            if not recursive:
+                out('skipping directory {0} (use -r)'.format(path))
+                continue
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    yield os.path.join(dirpath, name)
+        else:
+            yield path
+
+def cmdImport(args):
+    importer = BatchImport(_listFiles(args.paths, args.recursive),
+        threads=args.jobs, tag_name=args.tag)
+    def report(done, total, path):
+        out('[{0}/{1}] {2}'.format(done, total, path))
+    importer.run(report)
+    for (path, err) in importer.failed:
+        out('failed: {0}: {1}'.format(path, err))
+    out('{0} article(s) added, {1} with already stored file, {2} failed'.\
+        format(importer.imported, importer.linked, len(importer.failed)))
+    return 1 if importer.failed else 0
+
+def cmdExport(args):
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    query = searchquery.articleQuery(args.query)
+    if args.ids:
+        query = query.filter(Article.id.in_(args.ids))
+    count = 0
+    for article in query.yield_per(100):
+        if article.blob is None: continue
+        name = (article.title or str(article.id)).replace(os.sep, '_')
+        path = os.path.join(args.output, name + article.fileSuffix())
+        if os.path.exists(path):
+            path = os.path.join(args.output, '{0}-{1}{2}'.format(name, article.id, article.fileSuffix()))
+        article.saveToFile(path)
+        out(path)
+        count += 1
+    out('{0} file(s) exported'.format(count))
+    return 0
+
+def cmdSearch(args):
+    if args.attach:
+        libraries = ['main'] + [database.attach(path) for path in args.attach]
+        paths = dict(database.attachedLibraries(), main=args.db)
+        for (library, article_id, title) in searchquery.libraryArticleQuery(args.query, libraries):
+            out(u'{0}\t{1}\t{2}'.format(paths[library], article_id, title or ''))
+        return 0
+    for article in searchquery.articleQuery(args.query).yield_per(100):
+        out(u'{0}\t{1}'.format(article.id, article.title or ''))
+    return 0
+
+def cmdStats(args):
+    session = pdfrog.session
+    out('articles:      {0}'.format(session.query(Article).count()))
+    out('authors:       {0}'.format(session.query(Author).count()))
+    out('tags:          {0}'.format(session.query(Tag).count()))
+    out('stored files:  {0}'.format(session.query(FileBlob).count()))
+    file_size = session.query(sa.func.sum(Article.filesize)).scalar() or 0
+    blob_size = session.query(sa.func.sum(FileBlob.size)).scalar() or 0
+    stored_size = session.query(sa.func.sum(sa.func.length(FileBlobChunk.data))).scalar() or 0
+    out('files size:    {0} bytes'.format(file_size))
+    out('deduplicated:  {0} bytes'.format(blob_size))
+    out('compressed:    {0} bytes'.format(stored_size))
+    for (status, count) in session.query(Article.textstatus, sa.func.count()).\
+            group_by(Article.textstatus):
+        out('text {0}: {1}'.format(status or 'pending', count))
+    return 0
+
+def cmdVerify(args):
+    """checks database integrity and every stored file against its digest"""
+    session = pdfrog.session
+    problems = 0
+    for (result,) in session.execute('PRAGMA quick_check'):
+        if result != 'ok':
+            out('sqlite: ' + result)
+            problems += 1
+    for blob in session.query(FileBlob).yield_per(100):
+        h = hashlib.sha256()
+        size = 0
+        try:
+            for data in blob.iterData():
+                h.update(data)
+                size += len(data)
+        except Exception as e:
+            out('blob {0}: unreadable: {1}'.format(blob.id, e))
+            problems += 1
+            continue
+        if h.hexdigest() != blob.digest or size != blob.size:
+            out('blob {0}: contents do not match digest'.format(blob.id))
+            problems += 1
+    refs = sa.select([sa.func.count()]).where(Article.blob_id == FileBlob.id).as_scalar()
+    for (blob_id, refcount, actual) in session.query(FileBlob.id, FileBlob.refcount, refs).\
+            filter(FileBlob.refcount != refs):
+        out('blob {0}: refcount is {1}, referenced {2} time(s)'.format(blob_id, refcount, actual))
+        problems += 1
+    for (article_id,) in session.query(Article.id).outerjoin(Article.blob).\
+            filter(Article.blob_id != None, FileBlob.id == None):
+        out('article {0}: file is missing'.format(article_id))
+        problems += 1
+    out('{0} problem(s) found'.format(problems))
+    return 1 if problems else 0
+
+def cmdExtract(args):
+    if args.retry_failed:
+        out('{0} failed article(s) to retry'.format(textextract.retryFailed(pdfrog.session)))
+        pdfrog.session.commit()
+    session = sa.orm.Session(bind=pdfrog.session.bind)
+    extraction = textextract.TextExtraction(session, processes=args.jobs)
+    out('{0} article(s) to process'.format(extraction.pendingCount()))
+    done = 0
+    for results in extraction.batches():
+        textextract.storeResults(pdfrog.session, results)
+        pdfrog.session.commit()
+        done += len(results)
+        for (article_id, status, text) in results:
+            out('{0}\t{1}'.format(article_id, status or 'skipped, tool not found'))
+    out('{0} article(s) processed'.format(done))
+    return 0
+
+def cmdGarbageCollect(args):
+    FileBlob.collectGarbage()
+    pdfrog.session.commit()
+    return 0
+
+def cmdRebuildCounters(args):
+    rebuildCounters(pdfrog.session)
+    rebuildNames(pdfrog.session)
+    pdfrog.session.commit()
+    return 0
+
+def cmdBench(args):
+    for profile in args.profiles or sorted(storage.PROFILES):
+        out(profile)
+        for (what, seconds) in storage.benchmark(profile, args.rows):
+            out('  {0:<28}{1:8.3f} s'.format(what, seconds))
+    return 0
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog='pdfrog', description='pdfrog database tool')
+    parser.add_argument('--db', default=database.DEFAULT_PATH, help='database file')
+    parser.add_argument('--profile', choices=sorted(storage.PROFILES), default=None,
+        help='storage profile, see storage.py')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    p = commands.add_parser('import', help='add files as new articles')
+    p.add_argument('paths', nargs='+', metavar='path')
+    p.add_argument('-r', '--recursive', action='store_true', help='descend into directories')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='files read and compressed in parallel')
+    p.add_argument('--tag', default='new', help='tag for added articles')
+    p.set_defaults(func=cmdImport)
+
+    p = commands.add_parser('export', help='save files of found articles')
+    p.add_argument('query', nargs='?', default='', help='search bar syntax')
+    p.add_argument('-o', '--output', required=True, help='directory to save to')
+    p.add_argument('--id', dest='ids', type=int, action='append', help='article id')
+    p.set_defaults(func=cmdExport)
+
+    p = commands.add_parser('search', help='list found articles')
+    p.add_argument('query', help='search bar syntax')
+    p.add_argument('--attach', action='append', metavar='FILE',
+        help='search this library too (tag:, author: and words only)')
+    p.set_defaults(func=cmdSearch)
+
+    p = commands.add_parser('stats', help='show database statistics')
+    p.set_defaults(func=cmdStats)
+
+    p = commands.add_parser('verify', help='check stored files and references')
+    p.set_defaults(func=cmdVerify)
+
+    p = commands.add_parser('extract', help='extract plain text of articles')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='worker processes')
+    p.add_argument('--retry-failed', action='store_true',
+        help='try again articles extraction failed for earlier')
+    p.set_defaults(func=cmdExtract)
+
+    p = commands.add_parser('gc', help='remove files no article refers to')
+    p.set_defaults(func=cmdGarbageCollect)
+
+    p = commands.add_parser('rebuild-counters', help='recount tag and author usage, redo names shown in article list')
+    p.set_defaults(func=cmdRebuildCounters)
+
+    p = commands.add_parser('bench', help='compare storage profiles on scratch database')
+    p.add_argument('profiles', nargs='*', metavar='profile', help='profiles to try, all by default')
+    p.add_argument('--rows', type=int, default=2000, help='rows to write and read')
+    p.set_defaults(func=cmdBench, scratch=True)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArgs(argv)
+    if not getattr(args, 'scratch', False):
+        database.connect(args.db, profile=args.profile)
+    return args.func(args)
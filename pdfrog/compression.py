@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/compression.py
+import zlib
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+from pdfrog import config
+
+class Codec(object):
+    """wraps streaming compressor and decompressor of some library"""
+    def __init__(self, name, compressor, decompressor):
+        self.name = name
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    def compress(self, chunks):
+        """yields compressed data for iterable of chunks"""
+        c = self.compressor()
+        for chunk in chunks:
+            out = c.compress(chunk)
+            if out: yield out
+        out = c.flush()
+        if out: yield out
+
+    def decompress(self, chunks):
+        """yields decompressed data for iterable of compressed chunks"""
+        d = self.decompressor()
+        for chunk in chunks:
+            out = d.decompress(chunk)
+            if out: yield out
+        if hasattr(d, 'flush'):
+            out = d.flush()
+            if out: yield out
+
+codecs = {}
+
+def registerCodec(name, compressor, decompressor):
+    codecs[name] = Codec(name, compressor, decompressor)
+
+registerCodec('zlib', lambda: zlib.compressobj(6), zlib.decompressobj)
+if lzma is not None:
+    registerCodec('lzma', lambda: lzma.LZMACompressor(preset=6), lzma.LZMADecompressor)
+
+# size of the file head tried with every codec in 'auto' mode
+SAMPLE_SIZE = 1024 * 1024
+# codec is used only if it shrinks sample at least to this fraction
+MIN_RATIO = 0.9
+
+def chooseCodec(sample, setting=None):
+    """returns name of codec to store data beginning with sample, or None"""
+    if setting is None:
+        setting = config.get('storage', 'compression')
+    if setting == 'none':
+        return None
+    elif setting != 'auto':
+        if setting not in codecs: raise Exception('Unknown codec: ' + setting)
+        return setting
+    sample = sample[:SAMPLE_SIZE]
+    best_name = None
+    best_size = len(sample) * MIN_RATIO
+    for name in sorted(codecs):
+        size = sum(len(out) for out in codecs[name].compress([sample]))
+        if size < best_size:
+            best_name = name
+            best_size = size
+    return best_name
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/config.py
+# User settings. Values are read from $XDG_CONFIG_HOME/pdfrog/pdfrog.conf,
+# options missing there take values from defaults below.
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+import os
+
+defaults = {
+    'storage': {
+        'compression': 'auto',      # none, auto or codec name: zlib, lzma
+        'profile': 'wal',           # compatible, wal or fast, see storage.py
+        'writer_batch_size': '100', # background writes per commit
+        'commit_interval': '1.0',   # seconds, longest background write waits for commit
+        'checkpoint_interval': '30',    # seconds between background WAL checkpoints
+    },
+    'cache': {
+        'directory': '',            # extracted files, default ~/.cache/pdfrog/files
+        'quota': '1024',            # MiB
+    },
+    'extract': {
+        'processes': '0',           # 0 means one per CPU core
+        'batch_size': '50',         # articles per transaction
+    },
+    'autosave': {
+        'interval': '10',           # seconds changes may stay uncommitted
+        'max_pending': '500',       # changed objects that make commit happen sooner
+    },
+    'import': {
+        'threads': '4',             # files read and compressed in parallel
+        'batch_size': '200',        # articles per transaction
+    },
+}
+
+config_dir = os.path.join(os.environ.get('XDG_CONFIG_HOME', '') or \
+    os.path.expanduser('~/.config'), 'pdfrog')
+config_path = os.path.join(config_dir, 'pdfrog.conf')
+
+_parser = None
+
+def _load():
+    global _parser
+    _parser = configparser.RawConfigParser()
+    for section in defaults:
+        _parser.add_section(section)
+        for option, value in defaults[section].items():
+            _parser.set(section, option, value)
+    _parser.read(config_path)
+
+def get(section, option):
+    if _parser is None: _load()
+    return _parser.get(section, option)
+
+def getint(section, option):
+    if _parser is None: _load()
+    return _parser.getint(section, option)
+
+def override(section, option, value):
+    """changes setting for current run only"""
+    if _parser is None: _load()
+    _parser.set(section, option, str(value))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/database.py
+# Sessions. pdfrog.session is a registry giving every thread its own
+# session on the same engine, so code that says pdfrog.session.query(...)
+# works on whatever thread it runs. Worker threads do their work inside
+# unitOfWork(). ORM objects belong to the session (and thread) that loaded
+# them: pass ids, plain values or queries between threads, and load
+# objects again on the receiving side, e.g. with
+# query.with_session(pdfrog.session()), or merge objects the worker's
+# finished session left detached (see pagedmodel.adopt).
+#
+# Other libraries can be attached to opened one read-only-by-convention as
+# extra sqlite schemas, to be searched together with it in one query (see
+# searchquery.libraryArticleQuery).
+import collections
+import contextlib
+import os
+import re
+import weakref
+import sqlalchemy as sa
+import sqlalchemy.orm
+import pdfrog
+from pdfrog.datamodel import Base
+from pdfrog import migrate
+from pdfrog import storage
+from pdfrog import prefixindex
+
+DEFAULT_PATH = 'db.db'
+MAX_ATTACHED = 9        # sqlite allows 10 attached databases by default
+
+# engine: {schema name: path of library attached to its connections}
+_attached = weakref.WeakKeyDictionary()
+
+# autosave.py commits often, loaded objects should survive that
+Session = sa.orm.scoped_session(sa.orm.sessionmaker(expire_on_commit=False))
+
+@sa.event.listens_for(sa.orm.Session, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['flushed'] = True
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+@sa.event.listens_for(sa.orm.Session, 'after_rollback')
+def _transactionEnded(session):
+    session.info['flushed'] = False
+
+def hasUncommittedChanges(session):
+    """True if session holds changes other connections can't see yet"""
+    return bool(session.new or session.dirty or session.deleted or \
+        session.info.get('flushed'))
+
+def lockForWriting(session):
+    """takes database write lock for session's transaction
+
+    If another connection holds it longer than busy_timeout, raises
+    OperationalError, but unlike failed flush this leaves session and its
+    pending changes intact, so commit can be tried again later."""
+    # statement that writes nothing still needs the lock
+    session.execute('DELETE FROM article_tags WHERE 0')
+
+def connect(path=DEFAULT_PATH, echo=False, profile=None):
+    """opens database file, creating or upgrading it if needed
+
+    profile is storage profile name, see storage.py. Sets pdfrog.session,
+    returns engine."""
+    engine = openEngine(path, echo, profile)
+    useEngine(engine)
+    return engine
+
+def openEngine(path, echo=False, profile=None):
+    """engine for database file, which is created or upgraded if needed
+
+    Up-to-date file is only asked for its schema version and whether its
+    full-text index is usable, so opening it takes the same time whatever
+    its size. Raises sa.exc.DatabaseError if
+    file is not a database."""
+    engine = sa.create_engine('sqlite:///' + path, echo=echo)
+    storage.configure(engine, profile)
+    # every engine has its own libraries, so connections opened here (e.g.
+    # by upgrade) don't get ones attached to previously opened database
+    libraries = _attached[engine] = collections.OrderedDict()
+
+    @sa.event.listens_for(engine, 'connect')
+    def attachLibraries(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for (name, attached_path) in libraries.items():
+            cursor.execute('ATTACH DATABASE ? AS "{0}"'.format(name), (attached_path,))
+        cursor.close()
+
+    try:
+        if migrate.pending(engine):
+            Base.metadata.create_all(engine)
+            migrate.upgrade(engine)
+        migrate.syncFulltextIndex(engine)
+    except:
+        engine.dispose()
+        raise
+    return engine
+
+def useEngine(engine):
+    """makes pdfrog.session work with engine, closing previous database
+
+    Other threads must be done with their sessions by then."""
+    previous = currentEngine()
+    Session.remove()
+    Session.configure(bind=engine)
+    pdfrog.session = Session
+    prefixindex.reset()
+    if previous is not None and previous is not engine:
+        previous.dispose()
+
+def currentEngine():
+    return Session.session_factory.kw.get('bind')
+
+def libraryPath():
+    """file name of opened database"""
+    return currentEngine().url.database
+
+def attach(path):
+    """makes library at path searchable along with opened one
+
+    Returns schema name it's known by in queries. Only new connections get
+    it, so commit pdfrog.session first for it to see the library too."""
+    path = os.path.abspath(path)
+    libraries = _attached[currentEngine()]
+    for (name, attached_path) in libraries.items():
+        if attached_path == path: return name
+    if path == os.path.abspath(libraryPath()):
+        raise Exception('library is already opened: {0}'.format(path))
+    if len(libraries) >= MAX_ATTACHED:
+        raise Exception('too many attached libraries')
+    if not os.path.isfile(path):
+        raise Exception('no such library: {0}'.format(path))
+    base = re.sub(r'\W', '_', os.path.splitext(os.path.basename(path))[0]) or 'library'
+    name = 'lib_' + base
+    number = 1
+    while name in libraries:
+        number += 1
+        name = 'lib_{0}_{1}'.format(base, number)
+
+    # check it once on a plain connection instead of failing every query
+    conn = sa.create_engine('sqlite:///' + path).connect()
+    try:
+        if 'articles' not in sa.inspect(conn).get_table_names():
+            raise Exception('not a pdfrog library: {0}'.format(path))
+    except sa.exc.DatabaseError:
+        raise Exception('not a pdfrog library: {0}'.format(path))
+    finally:
+        conn.close()
+
+    libraries[name] = path
+    currentEngine().dispose()       # drops pooled connections lacking it
+    return name
+
+def detach(name):
+    del _attached[currentEngine()][name]
+    currentEngine().dispose()
+
+def attachedLibraries():
+    """list of (schema name, path)"""
+    return list(_attached[currentEngine()].items())
+
+@contextlib.contextmanager
+def unitOfWork():
+    """session for a piece of work, committed at the end or rolled back on error
+
+    On a thread which has no session yet (a worker) it becomes the thread's
+    pdfrog.session and is discarded afterwards; otherwise (GUI thread) it's
+    a separate session, so the work doesn't commit user's pending edits."""
+    separate = Session.registry.has()
+    session = Session.session_factory() if separate else Session()
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        if separate:
+            session.close()
+        else:
+            Session.remove()
@@ -5,13 +5,21 @@ import sqlalchemy.ext.declarative
 from sqlalchemy import func
 import os
 import pdfrog
+from pdfrog import compression
+from pdfrog import filecache
 import mimetypes
+import hashlib
+import io
 import subprocess
 import tempfile
 
 
 Base = sa.ext.declarative.declarative_base()
 
+def _sessionOf(obj):
+    """session obj belongs to, or current thread's one for new objects"""
+    return sa.orm.object_session(obj) or pdfrog.session
+
 author_article_pairs = sa.Table ('author_article_pairs', Base.metadata,
     sa.Column ('author_id', sa.Integer, sa.ForeignKey('authors.id'), index=True),
     sa.Column ('article_id', sa.Integer, sa.ForeignKey('articles.id'), index=True)
@@ -19,7 +27,8 @@ author_article_pairs = sa.Table ('author_article_pairs', Base.metadata,
 
 article_tag_pairs = sa.Table('article_tag_pairs', Base.metadata,
     sa.Column('article_id', sa.Integer, sa.ForeignKey('articles.id'), index=True),
-    sa.Column('tag_id', sa.Integer, sa.ForeignKey('article_tags.id'), index=True)
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('article_tags.id'), index=True),
+    sa.Index('ux_article_tag_pairs', 'article_id', 'tag_id', unique=True)
 )
 
 author_tag_pairs = sa.Table('author_tag_pairs', Base.metadata,
@@ -27,41 +36,52 @@ author_tag_pairs = sa.Table('author_tag_pairs', Base.metadata,
     sa.Column('tag_id', sa.Integer, sa.ForeignKey('author_tags.id'), index=True)
 )
 
+# how many articles of author have tag; kept by triggers on both pair
+# tables, see migrate.py
+author_article_tags = sa.Table('author_article_tags', Base.metadata,
+    sa.Column('author_id', sa.Integer, sa.ForeignKey('authors.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('article_tags.id'), primary_key=True, index=True),
+    sa.Column('article_count', sa.Integer, nullable=False, server_default='0')
+)
+
 class Author(Base):
     __tablename__ = 'authors'
     id =            sa.Column(sa.Integer, primary_key=True)
     name =          sa.Column(sa.String, unique=True)
-    organization =  sa.Column(sa.String)
+    organization =  sa.Column(sa.String, index=True)
     birthday =      sa.Column(sa.Date)
     info =          sa.Column(sa.String)
     notes =         sa.Column(sa.String)
     tags =          sa.orm.relationship('AuthorTag', secondary=author_tag_pairs, backref='authors')
+    # kept by triggers on author_article_pairs, see migrate.py
+    article_count = sa.Column(sa.Integer, index=True, nullable=False, server_default='0')
 
     def getArticleCount(self):
         """counts article count this author have"""
-        if 'cached_article_count' in self.__dict__ \
-            and self not in pdfrog.session.dirty:
-                return self.cached_article_count
-        cnt = pdfrog.session.query(author_article_pairs).\
-            filter(author_article_pairs.c.author_id == self.id).count()
-        self.cached_article_count = cnt
-        return cnt
+        return self.article_count or 0
 
     def getArticleTags(self):
-        if 'cached_article_tags' in self.__dict__ \
-            and self not in pdfrog.session.dirty:
-                return self.cached_article_tags
-        tags = set()
-        article_list = pdfrog.session.query(Article).join(Article.authors).\
-            filter(Author.id==self.id)
-        for article in article_list:
-            for tag in article.tags:  tags.add(tag)
-        tags = sorted(tags, key=lambda tag: tag.name)
-        self.cached_article_tags = tags
-        return tags
+        """tags of this author's articles, sorted by name"""
+        return _sessionOf(self).query(Tag).\
+            join(author_article_tags, author_article_tags.c.tag_id == Tag.id).\
+            filter(author_article_tags.c.author_id == self.id).order_by(Tag.name).all()
+
+    @classmethod
+    def articleTagNames(self, author_ids):
+        """returns {author id: sorted names of tags of author's articles}"""
+        names = dict((author_id, []) for author_id in author_ids)
+        author_ids = list(names)
+        for start in range(0, len(author_ids), 500):
+            query = pdfrog.session.query(author_article_tags.c.author_id, Tag.name).\
+                filter(author_article_tags.c.tag_id == Tag.id).\
+                filter(author_article_tags.c.author_id.in_(author_ids[start:start + 500])).\
+                order_by(Tag.name)
+            for (author_id, name) in query:
+                names[author_id].append(name)
+        return names
 
     def removeFromDatabase(self):
-        pdfrog.session.delete(self)
+        _sessionOf(self).delete(self)
 
     @classmethod
     def byName(self, name):
@@ -79,14 +99,15 @@ class Article(Base):
     authors =     sa.orm.relationship('Author', secondary=author_article_pairs, backref='articles')
     tags =        sa.orm.relationship('Tag', secondary=article_tag_pairs, backref='articles')
     keywords =    sa.Column(sa.String, index=True)
-    abstract =    sa.Column(sa.String)
-    plaintext =   sa.Column(sa.String)
-    fileblob =    sa.Column(sa.Binary)
+    abstract =    sa.orm.deferred(sa.Column(sa.String), group='text')
+    plaintext =   sa.orm.deferred(sa.Column(sa.String), group='text')
+    blob_id =     sa.Column(sa.Integer, sa.ForeignKey('fileblobs.id'), index=True)
+    blob =        sa.orm.relationship('FileBlob')
     filemime =    sa.Column(sa.String, index=True)   # mime
     filecompr =   sa.Column(sa.String, index=True)   # compression
     filesize =    sa.Column(sa.Integer, index=True)
     md5 =         sa.Column(sa.String, index=True)
-    j_issue_id =  sa.Column(sa.Integer, sa.ForeignKey('journalissues.id'))
+    j_issue_id =  sa.Column(sa.Integer, sa.ForeignKey('journalissues.id'), index=True)
     journal_issue = sa.orm.relationship('JournalIssue', backref=sa.orm.backref('articles', order_by=id))
     recieved =    sa.Column(sa.Date, index=True)
     revised =     sa.Column(sa.Date, index=True)
@@ -94,10 +115,16 @@ class Article(Base):
     pages_from =  sa.Column(sa.Integer)
     pages_to =    sa.Column(sa.Integer)
     pages_total = sa.Column(sa.Integer, index=True)
+    textstatus =  sa.Column(sa.String, index=True)  # plaintext extraction, see textextract.py
+    # authors and tags as shown in lists and sorted by there, kept by
+    # triggers on pair tables and names (see migrate.py): first three
+    # authors in order they were added, then ", et. al."; all tags by name
+    author_names = sa.Column(sa.String, index=True)
+    tag_names =   sa.Column(sa.String, index=True)
 
     def addTagByName(self, tagname):
         if tagname == "": return
-        tags = pdfrog.session.query(Tag).filter(Tag.name == tagname).limit(1)
+        tags = _sessionOf(self).query(Tag).filter(Tag.name == tagname).limit(1)
         if tags.count() == 0:
             tag = Tag()
             tag.name = tagname
@@ -107,14 +134,14 @@ class Article(Base):
             self.tags.append(tag)
 
     def removeTagByName(self, tagname):
-        tags = pdfrog.session.query(Tag).filter(Tag.name == tagname).limit(1)
+        tags = _sessionOf(self).query(Tag).filter(Tag.name == tagname).limit(1)
         if tags.count() != 0:
             tag = tags[0]
             if self.tags.count(tag) != 0: self.tags.remove(tag)
 
     def addAuthorByName(self, authorname):
         if authorname == "": return None
-        authors = pdfrog.session.query(Author).filter(Author.name == authorname).limit(1)
+        authors = _sessionOf(self).query(Author).filter(Author.name == authorname).limit(1)
         if authors.count() > 0:
             author = authors[0]
         else:
@@ -124,46 +151,376 @@ class Article(Base):
         return author
 
     def removeAuthorByName(self, authorname):
-        authors = pdfrog.session.query(Author).filter(Author.name == authorname).limit(1)
+        authors = _sessionOf(self).query(Author).filter(Author.name == authorname).limit(1)
         if authors.count() > 0:
             author = authors[0]
             if self.authors.count(author) > 0: self.authors.remove(author)
 
+    @classmethod
+    def deleteMany(self, article_ids):
+        """deletes articles with given ids, without loading them
+
+        Their files are left for FileBlob.collectGarbage()."""
+        session = pdfrog.session
+        session.flush()
+        article_ids = list(article_ids)
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            for pairs in (author_article_pairs, article_tag_pairs):
+                session.execute(pairs.delete().where(pairs.c.article_id.in_(chunk)))
+            session.execute(Article.__table__.delete().where(Article.id.in_(chunk)))
+        deleted = set(article_ids)
+        for obj in list(session.identity_map.values()):
+            if type(obj) == Article and obj.id in deleted:
+                session.expunge(obj)
+            elif type(obj) in (Author, Tag, JournalIssue):
+                # collections and counters may refer to deleted articles
+                session.expire(obj)
+
+    def saveToFile(self, filename):
+        """writes attached file contents to filename"""
+        if self.blob is None: raise Exception('Article has no file attached')
+        with open(filename, 'wb') as f:
+            self.blob.writeTo(f)
+
+    def fileSuffix(self):
+        """file name extension for attached file, like .pdf or .ps.gz"""
+        suffix = mimetypes.guess_extension(self.filemime or '') or ''
+        for compr_ext in mimetypes.encodings_map:
+            if mimetypes.encodings_map[compr_ext] == self.filecompr:
+                suffix += compr_ext
+        return suffix
+
     @classmethod
     def openExternal(self, article):
         """launches external viewer via xdg-open"""
         if type(article) != Article: raise Exception('Not an Article object')
-        suffix = mimetypes.guess_extension(article.filemime)
-        for compr_ext in mimetypes.encodings_map:
-            if mimetypes.encodings_map[compr_ext] == article.filecompr:
-                suffix += compr_ext
-        tmpname = tempfile.mktemp(suffix, '', pdfrog.tmpdir)
-        with open(tmpname, 'wb') as f: f.write(article.fileblob)
+        if article.blob is None: raise Exception('Article has no file attached')
+        path = filecache.default().get(article.blob.digest, article.fileSuffix(), article.blob.writeTo)
         with open(os.devnull, 'w') as fnull:
-            subprocess.call(["xdg-open", tmpname], stderr=fnull)
+            subprocess.call(["xdg-open", path], stderr=fnull)
+
+
+class FileBlob(Base):
+    """file contents, kept apart from articles and split into chunks
+
+    Blobs are addressed by sha256 of their contents, so articles with the same
+    file share one blob. refcount is maintained by triggers on articles table
+    (see migrate.py); blobs nobody refers to are removed by collectGarbage().
+    Chunks may be compressed by codec (see compression.py), size and digest
+    are always of uncompressed contents."""
+    __tablename__ = 'fileblobs'
+    id =       sa.Column(sa.Integer, primary_key=True)
+    digest =   sa.Column(sa.String, index=True, unique=True)   # sha256
+    size =     sa.Column(sa.Integer)
+    codec =    sa.Column(sa.String)
+    refcount = sa.Column(sa.Integer, index=True, nullable=False, server_default='0')
+    chunks = sa.orm.relationship('FileBlobChunk', lazy='dynamic',
+                cascade='all, delete-orphan', order_by='FileBlobChunk.seq')
+
+    CHUNK_SIZE = 256 * 1024
+
+    def iterStoredData(self):
+        """yields chunks as they are stored, without loading them all"""
+        query = sa.orm.object_session(self).query(FileBlobChunk.data).\
+            filter(FileBlobChunk.blob_id == self.id).\
+            order_by(FileBlobChunk.seq).yield_per(1)
+        for (data,) in query:
+            yield data
+
+    def iterData(self):
+        """yields file contents piece by piece, decompressing if needed"""
+        if self.codec is None:
+            return self.iterStoredData()
+        return compression.codecs[self.codec].decompress(self.iterStoredData())
+
+    def writeTo(self, f):
+        for data in self.iterData():
+            f.write(data)
+
+    @classmethod
+    def byDigest(self, digest):
+        """stored blob with given contents that some article refers to
+
+        Unreferenced ones are left out: garbage collector may be deleting
+        them in another thread, and reusing one would leave article with
+        missing file."""
+        return pdfrog.session.query(FileBlob).\
+            filter(FileBlob.digest == digest, FileBlob.refcount > 0).first()
+
+    @classmethod
+    def fromData(self, data):
+        """returns blob with given contents, reusing already stored one"""
+        blob = self.byDigest(hashlib.sha256(data).hexdigest())
+        if blob is None:
+            blob = self.fromFile(io.BytesIO(data))
+        return blob
+
+    @classmethod
+    def fromFile(self, f, hashes=()):
+        """stores contents of file object f, returns blob
+
+        hashlib objects from hashes are updated with contents too. If same
+        contents are stored already, existing blob is returned."""
+        packed = PackedFile(f, hashes)
+        try:
+            return self.fromPacked(packed)
+        finally:
+            packed.close()
+
+    @classmethod
+    def fromPacked(self, packed):
+        """stores PackedFile, returns blob
+
+        Only writes chunks, reading and compressing was done by PackedFile.
+        If same contents are stored already, existing blob is returned."""
+        session = pdfrog.session
+        blob = FileBlob(size=packed.size, codec=packed.codec)
+        session.add(blob)
+        session.flush()     # need blob.id for chunks; takes write lock
+        existing = self.byDigest(packed.digest)
+        if existing is not None:
+            session.execute(FileBlob.__table__.delete().where(FileBlob.id == blob.id))
+            session.expunge(blob)
+            return existing
+        # unreferenced copy waiting for garbage collection would clash on
+        # digest; this transaction holds write lock, so collector can't
+        # interfere until new blob is referenced and committed
+        self.deleteBlobs(session, FileBlob.__table__.c.digest == packed.digest)
+        blob.digest = packed.digest
+        chunks = FileBlobChunk.__table__
+        for (seq, data) in enumerate(packed.chunks()):
+            session.execute(chunks.insert(), dict(blob_id=blob.id, seq=seq, data=data))
+        return blob
+
+    @classmethod
+    def deleteBlobs(self, session, condition):
+        """deletes blobs matching condition on fileblobs table, with their chunks"""
+        blobs = FileBlob.__table__
+        chunks = FileBlobChunk.__table__
+        blob_ids = set(row[0] for row in session.execute(sa.select([blobs.c.id]).where(condition)))
+        if len(blob_ids) == 0: return
+        for obj in list(session.identity_map.values()):
+            if type(obj) == FileBlob and obj.id in blob_ids:
+                session.expunge(obj)
+        session.execute(chunks.delete().where(chunks.c.blob_id.in_(
+            sa.select([blobs.c.id]).where(condition))))
+        session.execute(blobs.delete().where(condition))
+
+    @classmethod
+    def collectGarbage(self, session=None):
+        """removes blobs not referenced by any article"""
+        session = session or pdfrog.session
+        session.flush()
+        self.deleteBlobs(session, FileBlob.__table__.c.refcount == 0)
+
+class FileBlobChunk(Base):
+    __tablename__ = 'fileblob_chunks'
+    blob_id = sa.Column(sa.Integer, sa.ForeignKey('fileblobs.id'), primary_key=True)
+    seq =     sa.Column(sa.Integer, primary_key=True)
+    data =    sa.Column(sa.Binary)
+
+class PackedFile(object):
+    """file contents read, hashed and compressed, ready to be stored as FileBlob
+
+    Packing needs no database, so it can be done on worker threads, leaving
+    FileBlob.fromPacked() only chunks to write. File is read piece by piece
+    and packed data waits in temporary file, kept in memory while small, so
+    memory use doesn't depend on file size. hashlib objects from hashes are
+    updated with contents too."""
+    SPOOL_SIZE = 4 * FileBlob.CHUNK_SIZE
+
+    def __init__(self, f, hashes=()):
+        sha256 = hashlib.sha256()
+        hashes = [sha256] + list(hashes)
+        head = f.read(compression.SAMPLE_SIZE)
+        self.codec = compression.chooseCodec(head)
+        self.size = 0
+        self.data = tempfile.SpooledTemporaryFile(self.SPOOL_SIZE)
+
+        def pieces():
+            data = head
+            while data:
+                self.size += len(data)
+                for h in hashes: h.update(data)
+                yield data
+                data = f.read(FileBlob.CHUNK_SIZE)
+
+        stored = pieces()
+        if self.codec is not None:
+            stored = compression.codecs[self.codec].compress(stored)
+        try:
+            for data in stored:
+                self.data.write(data)
+        except:
+            self.close()
+            raise
+        self.digest = sha256.hexdigest()
+
+    def chunks(self):
+        """yields packed data in pieces of FileBlob.CHUNK_SIZE"""
+        self.data.seek(0)
+        while True:
+            data = self.data.read(FileBlob.CHUNK_SIZE)
+            if not data: break
+            yield data
+
+    def close(self):
+        self.data.close()
 
 
 class Tag(Base):
     __tablename__ = 'article_tags'
     id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.String, unique=True)
+    # kept by triggers on article_tag_pairs, see migrate.py
+    usage_count = sa.Column(sa.Integer, index=True, nullable=False, server_default='0')
 
     def getUsageCount(self):
         """count how many times this tag used"""
-        if 'cached_usage_count' in self.__dict__ \
-            and self not in pdfrog.session.dirty:
-                return self.cached_usage_count
-        cnt = pdfrog.session.query(article_tag_pairs).\
-            filter(article_tag_pairs.c.tag_id == self.id).count()
-        self.cached_usage_count = cnt
-        return cnt
+        return self.usage_count or 0
+
+    @classmethod
+    def byName(self, name, create=False):
+        """tag with given name or None. Missing tag is created if create is set"""
+        tag = pdfrog.session.query(Tag).filter(Tag.name == name).first()
+        if tag is None and create:
+            tag = Tag(name=name)
+            pdfrog.session.add(tag)
+            pdfrog.session.flush()
+        return tag
+
+    def addToArticles(self, article_ids):
+        """tags articles with given ids, skipping already tagged ones"""
+        session = _sessionOf(self)
+        session.flush()
+        article_ids = list(article_ids)
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            session.execute(article_tag_pairs.insert().prefix_with('OR IGNORE').\
+                from_select(['article_id', 'tag_id'],
+                    sa.select([Article.id, sa.literal(self.id)]).where(Article.id.in_(chunk))))
+        self.expireArticles(article_ids)
+
+    def removeFromArticles(self, article_ids):
+        """removes tag from articles with given ids"""
+        session = _sessionOf(self)
+        session.flush()
+        article_ids = list(article_ids)
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            session.execute(article_tag_pairs.delete().\
+                where(article_tag_pairs.c.tag_id == self.id).\
+                where(article_tag_pairs.c.article_id.in_(chunk)))
+        self.expireArticles(article_ids)
+
+    def expireArticles(self, article_ids):
+        """makes loaded objects reload what was changed behind ORM's back"""
+        session = _sessionOf(self)
+        article_ids = set(article_ids)
+        for obj in list(session.identity_map.values()):
+            if type(obj) == Article and obj.id in article_ids:
+                session.expire(obj, ['tags', 'tag_names'])
+        session.expire(self, ['usage_count', 'articles'])
+
+    def taggedArticleIds(self):
+        session = _sessionOf(self)
+        session.flush()
+        return [row[0] for row in session.execute(
+            sa.select([article_tag_pairs.c.article_id]).where(article_tag_pairs.c.tag_id == self.id))]
 
     def discharge(self):
         """remove this tag from all articles (results in no its usage at all)"""
-        query = pdfrog.session.query(Article).join(article_tag_pairs).\
-                    filter(article_tag_pairs.c.tag_id == self.id)
-        for article in query:
-            article.tags.remove(self)
+        article_ids = self.taggedArticleIds()
+        _sessionOf(self).execute(article_tag_pairs.delete().\
+            where(article_tag_pairs.c.tag_id == self.id))
+        self.expireArticles(article_ids)
+
+    def mergeInto(self, target):
+        """moves all uses of this tag to target, then removes this tag"""
+        if target is self: return
+        session = _sessionOf(self)
+        article_ids = self.taggedArticleIds()
+        session.execute(article_tag_pairs.insert().prefix_with('OR IGNORE').\
+            from_select(['article_id', 'tag_id'],
+                sa.select([article_tag_pairs.c.article_id, sa.literal(target.id)]).\
+                    where(article_tag_pairs.c.tag_id == self.id)))
+        self.discharge()
+        target.expireArticles(article_ids)
+        session.delete(self)
+
+    def rename(self, new_name):
+        """renames tag, merging it into existing tag with new_name if any"""
+        target = Tag.byName(new_name)
+        if target is None:
+            self.name = new_name
+        else:
+            self.mergeInto(target)
+        return target or self
+
+@sa.event.listens_for(sa.orm.Session, 'after_flush')
+def _expireCounters(session, flush_context):
+    """makes objects reload counters and names changed by triggers during flush"""
+    counters = {Tag: ['usage_count'], Author: ['article_count']}
+    names = {'tags': ['tag_names'], 'authors': ['author_names']}
+    renamed = set()     # 'tags' and 'authors' if some tag or author name changed
+    for obj in list(session.dirty) + list(session.deleted):
+        if type(obj) in (Tag, Author) and (obj in session.deleted or \
+                sa.orm.attributes.get_history(obj, 'name').has_changes()):
+            renamed.add('tags' if type(obj) == Tag else 'authors')
+    for article in list(session.new) + list(session.dirty) + list(session.deleted):
+        if type(article) != Article: continue
+        for key in ('tags', 'authors'):
+            history = sa.orm.attributes.get_history(article, key,
+                passive=sa.orm.attributes.PASSIVE_NO_INITIALIZE)
+            changed = list(history.added or ()) + list(history.deleted or ())
+            if article in session.deleted:
+                changed += list(history.unchanged or ())
+            for obj in changed:
+                if sa.inspect(obj).persistent:
+                    session.expire(obj, counters[type(obj)])
+            if changed and article not in session.deleted:
+                session.expire(article, names[key])
+    if renamed:
+        # any loaded article may show changed name
+        for obj in list(session.identity_map.values()):
+            if type(obj) == Article:
+                session.expire(obj, [name for key in renamed for name in names[key]])
+
+def articleAuthorNamesSql(article_id):
+    """SQL expression for Article.author_names of article with id article_id (SQL)"""
+    return """NULLIF(coalesce((SELECT group_concat(name, ', ') FROM
+            (SELECT authors.name AS name FROM author_article_pairs
+                JOIN authors ON authors.id = author_article_pairs.author_id
+                WHERE author_article_pairs.article_id = {0}
+                ORDER BY author_article_pairs.rowid LIMIT 3)), '') ||
+        CASE WHEN (SELECT count(*) FROM author_article_pairs WHERE article_id = {0}) > 3
+            THEN ', et. al.' ELSE '' END, '')""".format(article_id)
+
+def articleTagNamesSql(article_id):
+    """SQL expression for Article.tag_names of article with id article_id (SQL)"""
+    return """(SELECT group_concat(name, ', ') FROM
+            (SELECT article_tags.name AS name FROM article_tag_pairs
+                JOIN article_tags ON article_tags.id = article_tag_pairs.tag_id
+                WHERE article_tag_pairs.article_id = {0}
+                ORDER BY article_tags.name))""".format(article_id)
+
+def rebuildNames(conn):
+    """recomputes Article.author_names and Article.tag_names"""
+    conn.execute('UPDATE articles SET author_names = {0}, tag_names = {1}'.format(
+        articleAuthorNamesSql('articles.id'), articleTagNamesSql('articles.id')))
+
+def rebuildCounters(conn):
+    """recounts Tag.usage_count, Author.article_count and author_article_tags"""
+    conn.execute('UPDATE article_tags SET usage_count = ' \
+        '(SELECT count(*) FROM article_tag_pairs WHERE tag_id = article_tags.id)')
+    conn.execute('UPDATE authors SET article_count = ' \
+        '(SELECT count(*) FROM author_article_pairs WHERE author_id = authors.id)')
+    conn.execute('DELETE FROM author_article_tags')
+    conn.execute('INSERT INTO author_article_tags (author_id, tag_id, article_count) ' \
+        'SELECT aap.author_id, atp.tag_id, count(DISTINCT aap.article_id) ' \
+        'FROM author_article_pairs aap JOIN article_tag_pairs atp ON atp.article_id = aap.article_id ' \
+        'GROUP BY aap.author_id, atp.tag_id')
 
 class AuthorTag(Base):
     __tablename__ = 'author_tags'
@@ -176,11 +533,53 @@ class Journal(Base):
     title =   sa.Column(sa.String, index=True)
 
     def articleCount(self):
-        return -1
+        return Journal.articleCounts([self.id]).get(self.id, 0)
+
+    @classmethod
+    def articleCounts(self, journal_ids):
+        """returns {journal id: number of articles in its issues}, one query per 500 ids"""
+        return _issueArticleCounts(JournalIssue.journal_id, journal_ids)
+
+    @classmethod
+    def articleCountKey(self):
+        """articleCount() as correlated SQL expression, for sorting"""
+        return sa.select([sa.func.count(Article.id)]).\
+            where(Article.j_issue_id == JournalIssue.id).\
+            where(JournalIssue.journal_id == Journal.id).\
+            correlate(Journal).as_scalar()
 
 class JournalIssue(Base):
     __tablename__ = 'journalissues'
     id =         sa.Column(sa.Integer, primary_key=True)
     year =       sa.Column(sa.Integer, index=True)
-    journal_id = sa.Column(sa.Integer, sa.ForeignKey('journals.id'))
+    journal_id = sa.Column(sa.Integer, sa.ForeignKey('journals.id'), index=True)
     journal =    sa.orm.relationship('Journal', backref=sa.orm.backref('journalissues', order_by=id))
+
+    def articleCount(self):
+        return JournalIssue.articleCounts([self.id]).get(self.id, 0)
+
+    @classmethod
+    def articleCounts(self, issue_ids):
+        """returns {issue id: number of its articles}, one query per 500 ids"""
+        return _issueArticleCounts(JournalIssue.id, issue_ids)
+
+    @classmethod
+    def articleCountKey(self):
+        """articleCount() as correlated SQL expression, for sorting"""
+        return sa.select([sa.func.count(Article.id)]).\
+            where(Article.j_issue_id == JournalIssue.id).\
+            correlate(JournalIssue).as_scalar()
+
+def _issueArticleCounts(group_column, ids):
+    """{id: number of articles} of issues grouped by group_column, a column of
+    journalissues; one query per 500 ids"""
+    counts = dict((group_id, 0) for group_id in ids)
+    ids = list(counts)
+    for start in range(0, len(ids), 500):
+        query = pdfrog.session.query(group_column, sa.func.count(Article.id)).\
+            join(Article, Article.j_issue_id == JournalIssue.id).\
+            filter(group_column.in_(ids[start:start + 500])).\
+            group_by(group_column)
+        for (group_id, count) in query:
+            counts[group_id] = count
+    return counts
@@ -5,6 +5,7 @@ from PySide.QtGui import *
 import pdfrog
 from pdfrog.datamodel import Article, Author
 from pdfrog.customwidgets import QLineEdit_focus, QListWidget_focus
+from pdfrog import prefixindex
 
 class EditArticleAuthorsDialog(QDialog):
     def __init__(self, parent, article):
@@ -28,6 +29,10 @@ class EditArticleAuthorsDialog(QDialog):
         self.remove_from_article_button = QPushButton("↓")
         dialog_buttons = QDialogButtonBox()
         dialog_buttons.addButton("Close", QDialogButtonBox.AcceptRole)
+        # author list is updated once typing pauses
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
 
         # parameters
         self.author_list.setSortingEnabled(True)
@@ -38,6 +43,7 @@ class EditArticleAuthorsDialog(QDialog):
         # signals
         dialog_buttons.accepted.connect(self.accept)
         dialog_buttons.rejected.connect(self.reject)
+        self.filter_timer.timeout.connect(self.updateAuthorList)
         self.author_name.textChanged.connect(self.authorNameTextChanged)
         self.author_name.cursorPositionChanged.connect(self.authorNameCursorPositionChanged)
         self.author_name.returnPressed.connect(self.authorNameReturnPressed)
@@ -76,10 +82,11 @@ class EditArticleAuthorsDialog(QDialog):
         self.remove_from_article_button.setEnabled(not to)
 
     def updateAuthorList(self):
+        names = prefixindex.authorNames().search(self.author_name.text())
+        if names == [self.author_list.item(row).text() for row in range(self.author_list.count())]:
+            return
         self.author_list.clear()
-        like_expr = '%' + self.author_name.text() + '%'
-        for author in pdfrog.session.query(Author).filter(Author.name.like(like_expr)).limit(300):
-            self.author_list.addItem(author.name)
+        self.author_list.addItems(names)
 
     def updateArticleAuthorList(self):
         self.article_author_list.clear()
@@ -88,7 +95,7 @@ class EditArticleAuthorsDialog(QDialog):
 
     def authorNameTextChanged(self):
         self._setButtonDirection(to=True)
-        self.updateAuthorList()
+        self.filter_timer.start()
 
     def updateAuthorInfo(self, author_name):
         author = pdfrog.session.query(Author).filter(Author.name == author_name)[0]
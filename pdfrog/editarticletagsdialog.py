@@ -5,6 +5,7 @@ from PySide.QtGui import *
 import pdfrog
 from pdfrog.datamodel import Article, Tag
 from pdfrog.customwidgets import QLineEdit_focus, QListWidget_focus
+from pdfrog import prefixindex
 
 class EditArticleTagsDialog(QDialog):
     def __init__(self, parent, article):
@@ -26,6 +27,10 @@ class EditArticleTagsDialog(QDialog):
         self.remove_tag_from_article = QPushButton("→")
         self.dialog_buttons = QDialogButtonBox()
         self.dialog_buttons.addButton("Close", QDialogButtonBox.AcceptRole)
+        # tag list is updated once typing pauses
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
 
         # widget parameters
         self.article_tag_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
@@ -33,6 +38,7 @@ class EditArticleTagsDialog(QDialog):
 
         # signals
         self.dialog_buttons.accepted.connect(self.accept)
+        self.filter_timer.timeout.connect(self.updateTagList)
         self.add_tag_to_article.clicked.connect(self.addTagToArticle)
         self.remove_tag_from_article.clicked.connect(self.removeTagFromArticle)
         self.tag_name.textChanged.connect(self._tagNameTextChanged)
@@ -75,10 +81,11 @@ class EditArticleTagsDialog(QDialog):
         self.remove_tag_from_article.setEnabled(not to)
 
     def updateTagList(self):
+        names = prefixindex.tagNames().search(self.tag_name.text())
+        if names == [self.tag_list.item(row).text() for row in range(self.tag_list.count())]:
+            return
         self.tag_list.clear()
-        like_string = '%' + self.tag_name.text() + '%'
-        for tag in pdfrog.session.query(Tag).filter(Tag.name.like(like_string)).limit(300):
-            self.tag_list.addItem(tag.name)
+        self.tag_list.addItems(names)
 
     def updateArticleTagList(self):
         self.article_tag_list.clear()
@@ -103,7 +110,7 @@ class EditArticleTagsDialog(QDialog):
 
     def _tagNameTextChanged(self, text):
         self.tag_source = "edit"
-        self.updateTagList()
+        self.filter_timer.start()
 
     def _tagNameCursorPositionChanged(self, old, new):
         self.tag_source = "edit"
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/filecache.py
+import os
+import tempfile
+from pdfrog import config
+
+class FileCache(object):
+    """directory of extracted files named by content digest, limited in size
+
+    Files are written under temporary name and then renamed, so a file with
+    final name is always complete. When total size exceeds quota, least
+    recently used files are removed; use time is kept in file mtime."""
+    def __init__(self, directory, quota):
+        self.directory = directory
+        self.quota = quota
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, digest, suffix=''):
+        return os.path.join(self.directory, digest + suffix)
+
+    def get(self, digest, suffix, writer):
+        """returns path of cached file, calls writer(f) to fill it if absent"""
+        path = self.path(digest, suffix)
+        if os.path.exists(path):
+            os.utime(path, None)    # mark as recently used
+            return path
+        (fd, tmpname) = tempfile.mkstemp('', '.tmp', self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.rename(tmpname, path)
+        except:
+            os.remove(tmpname)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """removes least recently used files until cache fits quota"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'): continue
+            path = os.path.join(self.directory, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        for (mtime, size, path) in sorted(entries):
+            if total <= self.quota: break
+            if path == keep: continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+_default = None
+
+def default():
+    """cache configured by [cache] section of config"""
+    global _default
+    if _default is None:
+        directory = config.get('cache', 'directory') or \
+            os.path.join(os.environ.get('XDG_CACHE_HOME', '') or \
+                os.path.expanduser('~/.cache'), 'pdfrog', 'files')
+        quota = config.getint('cache', 'quota') * 1024 * 1024
+        _default = FileCache(directory, quota)
+    return _default
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/fulltext.py
+# Full-text index over article texts. It's sqlite FTS5 table kept in sync
+# with articles by triggers (see migrate.py); when sqlite lacks FTS5 the
+# triggers are absent and search falls back to LIKE on title and keywords.
+import sqlite3
+import sqlalchemy as sa
+import pdfrog
+from pdfrog.datamodel import Article
+
+articles_fts = sa.Table('articles_fts', sa.MetaData(),
+    sa.Column('rowid', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String),
+    sa.Column('keywords', sa.String),
+    sa.Column('abstract', sa.String),
+    sa.Column('plaintext', sa.String),
+)
+
+COLUMNS = ('title', 'keywords', 'abstract', 'plaintext')
+
+_supported = None
+
+def supported():
+    """True if sqlite library in use has FTS5"""
+    global _supported
+    if _supported is None:
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+            _supported = True
+        except sqlite3.OperationalError:
+            _supported = False
+        finally:
+            conn.close()
+    return _supported
+
+def available(session=None, schema='main'):
+    """True if database (or one attached as schema) has up-to-date full-text index
+
+    Its triggers are dropped when file is opened by sqlite without FTS5,
+    table alone may be stale."""
+    if not supported(): return False
+    session = session or pdfrog.session
+    return session.execute('SELECT count(*) FROM "{0}".sqlite_master ' \
+        "WHERE type = 'trigger' AND name = 'articles_fts_insert'".format(schema)).scalar() > 0
+
+def matchExpression(terms):
+    """makes FTS5 query from search terms
+
+    Every term is a phrase, so "deep learning" matches these words in a row;
+    trailing '*' makes prefix query. All terms must match."""
+    parts = []
+    for term in terms:
+        prefix = term.endswith('*')
+        term = term.rstrip('*').strip()
+        if term == '': continue
+        parts.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+def filterArticles(query, terms):
+    """restricts Article query to ones matching all terms, best matches first"""
+    if not available(query.session):
+        for term in terms:
+            likestr = '%' + term.rstrip('*') + '%'
+            query = query.filter(sa.or_(Article.title.like(likestr), Article.keywords.like(likestr)))
+        return query
+    expr = matchExpression(terms)
+    if expr == '': return query
+    return query.join(articles_fts, articles_fts.c.rowid == Article.id).\
+        filter(sa.literal_column('articles_fts').op('MATCH')(expr)).\
+        order_by(sa.literal_column('bm25(articles_fts)'))
@@ -4,41 +4,66 @@
 from PySide.QtCore import *
 from PySide.QtGui import *
 import pdfrog
-from .datamodel import Journal
+from .datamodel import Journal, JournalIssue
+from .pagedmodel import PagedQueryModel
 
 class JournalList(QTableView):
     def __init__(self, parent=None):
         QTableView.__init__(self, parent)
         self.parent = parent
         self.setModel(JournalListModel(self))
+        self.activated.connect(self.findIssuesOfSelectedJournal)
         self.verticalHeader().setVisible(False)
         self.horizontalHeader().setMovable(True)
         self.horizontalHeader().setHighlightSections(False)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # no column is sorted until user clicks its header
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.setSortingEnabled(True)
         self.installEventFilter(self)
 
         self.query = None
-        self.refreshData()
 
-    def refreshData(self, query=None):
+    def refreshData(self, query=None, total=None, first_page=None):
         if query is None:
-            query = self.query or pdfrog.session.query(Journal).limit(300)
+            query = self.query or pdfrog.session.query(Journal)
         self.query = query
+        # model drops sort keys, results come in query's own order
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        return self.model().setQuery(query, total, first_page)
+
+    def clearData(self):
+        """forgets query and shown rows, e.g. when another library is opened"""
+        self.query = None
         self.model().clearData()
-        item_count = 0
-        for journal in query:
-            self.model().appendJournal(journal)
-            item_count += 1
-        return item_count
 
     def createMenu(self, journal_menu):
         journal_refresh_list_action = QAction(QIcon.fromTheme("view-refresh"), "Refresh list", self)
         journal_refresh_list_action.triggered.connect(self.refreshData)
 
+        journal_find_articles_action = QAction(QIcon.fromTheme("edit-find"), "Find articles", self)
+        journal_find_articles_action.triggered.connect(self.findArticlesOfSelectedJournal)
+
+        journal_find_issues_action = QAction("Show issues", self)
+        journal_find_issues_action.triggered.connect(self.findIssuesOfSelectedJournal)
+
         journal_menu.addAction(journal_refresh_list_action)
+        journal_menu.addAction(journal_find_articles_action)
+        journal_menu.addAction(journal_find_issues_action)
         self.context_menu = journal_menu
 
+    def findArticlesOfSelectedJournal(self):
+        idxs = self.selectionModel().selectedRows()
+        if len(idxs) > 0:
+            journal = self.item(idxs[0].row())
+            self.parent.findArticlesByJournal(journal.id)
+
+    def findIssuesOfSelectedJournal(self):
+        idxs = self.selectionModel().selectedRows()
+        if len(idxs) > 0:
+            journal = self.item(idxs[0].row())
+            self.parent.findIssuesByJournal(journal.id)
+
     def item(self, row):
         return self.model().item(row)
 
@@ -50,29 +75,28 @@ class JournalList(QTableView):
             return QTableView.eventFilter(self, obj, event)
 
 
-class JournalListModel(QAbstractTableModel):
+class JournalListModel(PagedQueryModel):
     def __init__(self, parent=None):
-        QAbstractTableModel.__init__(self, parent)
-        self.datastore = []
+        PagedQueryModel.__init__(self, Journal.id, parent)
         self.view = parent
+        self.article_counts = {}
 
     COLUMN_TITLE = 0
     COLUMN_ARTICLE_COUNT = 1
 
-    def rowCount(self, parent=None):
-        return len(self.datastore)
-
     def columnCount(self, parent=None):
         return 2
 
     def data(self, index, role = Qt.DisplayRole):
         if not index.isValid(): return None
         if role == Qt.DisplayRole:
+            journal = self.shownItem(index.row())
+            if journal is None: return None
             column = index.column()
             if column == self.COLUMN_TITLE:
-                return self.datastore[index.row()].title
+                return journal.title
             elif column == self.COLUMN_ARTICLE_COUNT:
-                return str(self.datastore[index.row()].articleCount())
+                return str(self.article_counts.get(journal.id, 0))
             else:
                 return "unknown"
         else:
@@ -86,22 +110,112 @@ class JournalListModel(QAbstractTableModel):
                 else: return "Unknown"
         return None
 
-    def appendJournal(self, journal):
-        self.beginInsertRows(QModelIndex(), len(self.datastore), len(self.datastore))
-        self.datastore.append(journal)
-        self.endInsertRows()
+    def setQuery(self, query, total=None, first_page=None):
+        self.article_counts = {}
+        return PagedQueryModel.setQuery(self, query, total, first_page)
 
-    def clearData(self):
-        self.modelReset.emit()
-        self.datastore = []
+    def fetchExtra(self, journals):
+        """article counts of page of journals"""
+        return Journal.articleCounts([journal.id for journal in journals])
+
+    def addExtra(self, article_counts):
+        self.article_counts.update(article_counts)
 
     def sort(self, column, order):
-        self.layoutAboutToBeChanged.emit()
         if column == self.COLUMN_TITLE:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.title, reverse=(order == Qt.DescendingOrder))
+            self.sortQuery([(Journal.title, order == Qt.DescendingOrder)])
         elif column == self.COLUMN_ARTICLE_COUNT:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.articleCount(), reverse=(order == Qt.DescendingOrder))
-        self.layoutChanged.emit()
+            self.sortQuery([(Journal.articleCountKey(), order == Qt.DescendingOrder)])
+
+
+class JournalIssueList(QTableView):
+    """issues of a journal, opened from journal list"""
+    def __init__(self, parent=None):
+        QTableView.__init__(self, parent)
+        self.parent = parent
+        self.setModel(JournalIssueListModel(self))
+        self.activated.connect(self.findArticlesOfSelectedIssue)
+        self.verticalHeader().setVisible(False)
+        self.horizontalHeader().setHighlightSections(False)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # no column is sorted until user clicks its header
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.setSortingEnabled(True)
+
+        self.query = None
+
+    def refreshData(self, query=None, total=None, first_page=None):
+        if query is None:
+            if self.query is None: return
+            query = self.query
+        self.query = query
+        # model drops sort keys, results come in query's own order
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        return self.model().setQuery(query, total, first_page)
+
+    def clearData(self):
+        """forgets query and shown rows, e.g. when another library is opened"""
+        self.query = None
+        self.model().clearData()
+
+    def findArticlesOfSelectedIssue(self):
+        idxs = self.selectionModel().selectedRows()
+        if len(idxs) > 0:
+            issue = self.item(idxs[0].row())
+            self.parent.findArticlesByIssue(issue.id)
 
     def item(self, row):
-        return self.datastore[row]
+        return self.model().item(row)
+
+
+class JournalIssueListModel(PagedQueryModel):
+    def __init__(self, parent=None):
+        PagedQueryModel.__init__(self, JournalIssue.id, parent)
+        self.view = parent
+        self.article_counts = {}
+
+    COLUMN_YEAR = 0
+    COLUMN_ARTICLE_COUNT = 1
+
+    def columnCount(self, parent=None):
+        return 2
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid(): return None
+        if role == Qt.DisplayRole:
+            issue = self.shownItem(index.row())
+            if issue is None: return None
+            column = index.column()
+            if column == self.COLUMN_YEAR:
+                return '' if issue.year is None else str(issue.year)
+            elif column == self.COLUMN_ARTICLE_COUNT:
+                return str(self.article_counts.get(issue.id, 0))
+            else:
+                return "unknown"
+        else:
+            return None
+
+    def headerData(self, column, orientation, role = Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                if column == self.COLUMN_YEAR: return "Year"
+                elif column == self.COLUMN_ARTICLE_COUNT: return "Article Count"
+                else: return "Unknown"
+        return None
+
+    def setQuery(self, query, total=None, first_page=None):
+        self.article_counts = {}
+        return PagedQueryModel.setQuery(self, query, total, first_page)
+
+    def fetchExtra(self, issues):
+        """article counts of page of issues"""
+        return JournalIssue.articleCounts([issue.id for issue in issues])
+
+    def addExtra(self, article_counts):
+        self.article_counts.update(article_counts)
+
+    def sort(self, column, order):
+        if column == self.COLUMN_YEAR:
+            self.sortQuery([(JournalIssue.year, order == Qt.DescendingOrder)])
+        elif column == self.COLUMN_ARTICLE_COUNT:
+            self.sortQuery([(JournalIssue.articleCountKey(), order == Qt.DescendingOrder)])
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/librarysearchdialog.py
+# Searches opened library together with other library files attached to
+# it. All of them are searched by one UNION ALL query running in
+# background, see searchquery.libraryArticleQuery.
+import os
+from PySide.QtCore import *
+from PySide.QtGui import *
+from pdfrog import database
+from pdfrog import searchquery
+from pdfrog.querythread import QueryExecutor
+
+class LibrarySearchDialog(QDialog):
+    MAX_ROWS = 500      # results shown
+
+    def __init__(self, mainwnd):
+        QDialog.__init__(self, mainwnd)
+        self.mainwnd = mainwnd
+        self.setWindowTitle("Search libraries")
+        self.resize(600, 450)
+        self.query_executor = QueryExecutor(self, save=mainwnd.autosave.save)
+        self.found = []     # (library, article id) of result rows
+
+        self.createWidgets()
+        self.updateLibraryList()
+
+    def createWidgets(self):
+        self.library_list = QListWidget()
+        self.attach_button = QPushButton("Attach ...")
+        self.detach_button = QPushButton("Detach")
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText('Search all libraries: tag:, author: and words')
+        search_button = QPushButton("→")
+        self.results = QTableWidget(0, 2)
+        self.results.setHorizontalHeaderLabels(["Library", "Title"])
+        self.results.horizontalHeader().setStretchLastSection(True)
+        self.results.verticalHeader().setVisible(False)
+        self.results.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.results.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.status = QLabel()
+        self.dialog_buttons = QDialogButtonBox()
+        self.dialog_buttons.addButton("Close", QDialogButtonBox.RejectRole)
+
+        # signals
+        self.attach_button.clicked.connect(self.attachLibrary)
+        self.detach_button.clicked.connect(self.detachLibrary)
+        self.search_bar.returnPressed.connect(self.search)
+        search_button.clicked.connect(self.search)
+        self.results.cellActivated.connect(self.openResult)
+        self.dialog_buttons.rejected.connect(self.reject)
+
+        # arrange widgets
+        grid = QGridLayout()
+        grid.addWidget(QLabel("Attached libraries:"), 0, 0, 1, 2)
+        grid.addWidget(self.library_list, 1, 0, 2, 1)
+        grid.addWidget(self.attach_button, 1, 1)
+        grid.addWidget(self.detach_button, 2, 1, Qt.AlignTop)
+        grid.addWidget(self.search_bar, 3, 0)
+        grid.addWidget(search_button, 3, 1)
+        grid.addWidget(self.results, 4, 0, 1, 2)
+        grid.addWidget(self.status, 5, 0, 1, 2)
+        grid.addWidget(self.dialog_buttons, 6, 0, 1, 2)
+        grid.setRowStretch(4, 1)
+        self.setLayout(grid)
+
+    def updateLibraryList(self):
+        self.library_list.clear()
+        for (name, path) in database.attachedLibraries():
+            item = QListWidgetItem(path)
+            item.setData(Qt.UserRole, name)
+            self.library_list.addItem(item)
+        self.detach_button.setEnabled(self.library_list.count() > 0)
+
+    def libraryPath(self, name):
+        if name == 'main':
+            return database.libraryPath()
+        return dict(database.attachedLibraries()).get(name, name)
+
+    def attachLibrary(self):
+        fl = QFileDialog.getOpenFileNames(self, "Attach libraries",
+            filter="pdfrog libraries (*.db);; All Files (*.*)")
+        for path in fl[0]:
+            try:
+                self.mainwnd.attachLibrary(path)
+            except Exception as e:
+                QMessageBox.warning(self, "Attach", str(e))
+        self.updateLibraryList()
+
+    def detachLibrary(self):
+        item = self.library_list.currentItem()
+        if item is None: return
+        database.detach(item.data(Qt.UserRole))
+        self.updateLibraryList()
+
+    def search(self):
+        text = self.search_bar.text()
+        libraries = ['main'] + [name for (name, path) in database.attachedLibraries()]
+        self.status.setText('Searching {0} libraries ...'.format(len(libraries)))
+        def work(session):
+            query = searchquery.libraryArticleQuery(text, libraries, session)
+            return (query.count(), query.limit(self.MAX_ROWS).all())
+        self.query_executor.submit('libraries', work, self.showResults, self.searchFailed)
+
+    def showResults(self, result, seconds):
+        (total, rows) = result
+        self.found = [(library, article_id) for (library, article_id, title) in rows]
+        self.results.setRowCount(len(rows))
+        for (row, (library, article_id, title)) in enumerate(rows):
+            library_name = os.path.basename(self.libraryPath(library))
+            self.results.setItem(row, 0, QTableWidgetItem(library_name))
+            self.results.setItem(row, 1, QTableWidgetItem(title or ''))
+        shown = '' if total <= len(rows) else ', first {0} shown'.format(len(rows))
+        self.status.setText('{0} article(s){1}, {2:.2f} s'.format(total, shown, seconds))
+
+    def searchFailed(self, message):
+        self.status.setText('Search failed: ' + message)
+
+    def openResult(self, row, column):
+        """shows found article, switching to its library if needed"""
+        (library, article_id) = self.found[row]
+        if library != 'main':
+            path = self.libraryPath(library)
+            answer = QMessageBox.question(self, "Open",
+                "Article is in another library. Open {0}?".format(path),
+                QMessageBox.Yes | QMessageBox.No)
+            if answer != QMessageBox.Yes: return
+            # libraries are attached to opened one, switching drops them
+            self.accept()
+            if not self.mainwnd.openLibrary(path): return
+        self.mainwnd.showArticle(article_id)
+
+    def done(self, result):
+        self.query_executor.stop()
+        QDialog.done(self, result)
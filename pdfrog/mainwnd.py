@@ -7,26 +7,55 @@ from pdfrog.addfiledialog import AddFileDialog
 from pdfrog.articlelistwidget import ArticleList
 from .taglistwidget import TagList
 from .authorlistwidget import AuthorList
-from .journallistwidget import JournalList
+from .journallistwidget import JournalList, JournalIssueList
+from pdfrog import searchquery
+from pdfrog import textextract
+from pdfrog.textextractthread import TextExtractThread
+from pdfrog.blobgcthread import BlobGarbageCollectThread
+from pdfrog.querythread import QueryExecutor
+from pdfrog.storage import BackgroundWriter
+from pdfrog.autosave import AutoSave
+from pdfrog.batchimport import BatchImport
+from pdfrog.librarysearchdialog import LibrarySearchDialog
+from pdfrog import database
 import pdfrog
+import sqlalchemy as sa
 import tempfile
 import subprocess
 import os
-import shlex
 
 class MainWnd (QMainWindow):
+    # emitted by background writer's thread, shown in GUI thread
+    backgroundWritesFailed = Signal(int, str)
+
     def __init__(self, parent=None):
         super(MainWnd, self).__init__(parent)
-        self.setWindowTitle("pdfrog")
         self.resize(600, 400)
         self.setAcceptDrops(True)
+        self.text_extract_thread = None
+        self.blob_gc_thread = None
+        self.blob_gc_pending = False
+        self.tab_searches = {}      # tab page: method filling its list
+        self.unloaded_tabs = set()  # pages with list not filled since library was opened
+        self.autosave = AutoSave(self)
+        self.autosave.stateChanged.connect(self.saveStateChanged)
+        self.autosave.saved.connect(self.databaseSaved)
+        self.autosave.failed.connect(self.saveFailed)
+        self.autosave.lost.connect(self.changesLost)
+        # queries run in background see only committed changes
+        self.query_executor = QueryExecutor(self, save=self.autosave.save)
 
         self.createWidgets()
         self.createMenus()
-        self.statusBar()
+        self.save_state_label = QLabel()
+        self.statusBar().addPermanentWidget(self.save_state_label)
+
+        self.backgroundWritesFailed.connect(self.showBackgroundWritesFailed)
+        self.libraryOpened()
 
     def createWidgets(self):
         self.article_list = ArticleList()
+        self.article_list.articlesDeleted.connect(self.articlesDeleted)
         self.article_list.show()
 
         self.author_list = AuthorList(parent=self)
@@ -35,7 +64,12 @@ class MainWnd (QMainWindow):
         self.tag_list = TagList()
         self.tag_list.show()
 
-        self.journal_list = JournalList()
+        self.journal_list = JournalList(parent=self)
+        self.issue_list = JournalIssueList(parent=self)
+        # lists load pages through main window's executor, stopped when library closes
+        for widget in (self.article_list, self.author_list, self.tag_list, self.journal_list,
+                       self.issue_list):
+            widget.model().executor = self.query_executor
 
         self.article_search_bar = QLineEdit();
         self.article_search_bar.setPlaceholderText('Filter articles...')
@@ -74,6 +108,7 @@ class MainWnd (QMainWindow):
         articles_compaund_page = QWidget()
         articles_compaund_page.setLayout(box1)
         tab_widget.addTab(articles_compaund_page, "Articles")
+        self.tab_searches[articles_compaund_page] = self.articleSearchBarReturnPressed
 
         # author list page
         box2 = QGridLayout()
@@ -83,6 +118,7 @@ class MainWnd (QMainWindow):
         authors_compound_page = QWidget()
         authors_compound_page.setLayout(box2)
         tab_widget.addTab(authors_compound_page, "Authors")
+        self.tab_searches[authors_compound_page] = self.authorSearchBarReturnPressed
 
         # tag list page
         box3 = QGridLayout()
@@ -92,15 +128,22 @@ class MainWnd (QMainWindow):
         tags_compound_page = QWidget()
         tags_compound_page.setLayout(box3)
         tab_widget.addTab(tags_compound_page, "Tags")
+        self.tab_searches[tags_compound_page] = self.tagSearchBarReturnPressed
 
         # journal list page
         box4 = QGridLayout()
         box4.addWidget(self.journal_search_bar, 0, 0)
         box4.addWidget(journal_search_button, 0, 1)
-        box4.addWidget(self.journal_list, 1, 0, 1, 2)
+        journal_splitter = QSplitter()
+        journal_splitter.addWidget(self.journal_list)
+        journal_splitter.addWidget(self.issue_list)
+        journal_splitter.setStretchFactor(0, 2)
+        journal_splitter.setStretchFactor(1, 1)
+        box4.addWidget(journal_splitter, 1, 0, 1, 2)
         journals_compound_page = QWidget()
         journals_compound_page.setLayout(box4)
         tab_widget.addTab(journals_compound_page, "Journals")
+        self.tab_searches[journals_compound_page] = self.journalSearchBarReturnPressed
 
     def createMenus(self):
         exit_action = QAction('E&xit', self)
@@ -108,10 +151,14 @@ class MainWnd (QMainWindow):
         exit_action.setStatusTip('Exit application')
         exit_action.triggered.connect(self.close)
 
-        open_action = QAction('Open', self)
+        open_action = QAction('Open ...', self)
         open_action.setShortcut('Ctrl+O')
         open_action.triggered.connect(self.openDatabase)
 
+        search_libraries_action = QAction('Search libraries ...', self)
+        search_libraries_action.setStatusTip('Search this and other library files together')
+        search_libraries_action.triggered.connect(self.searchLibraries)
+
         save_action = QAction('&Save', self)
         save_action.setShortcut('Ctrl+S')
         save_action.triggered.connect(self.saveDatabase)
@@ -119,11 +166,17 @@ class MainWnd (QMainWindow):
         add_files_action = QAction('Add files...', self)
         add_files_action.triggered.connect(self.addFilesDialog)
 
+        extract_text_action = QAction('Extract text', self)
+        extract_text_action.setStatusTip('Extract plain text of articles for full-text search')
+        extract_text_action.triggered.connect(self.extractText)
+
         db_menu = self.menuBar().addMenu("Database")
         db_menu.addAction(open_action)
         db_menu.addAction(save_action)
+        db_menu.addAction(search_libraries_action)
         db_menu.addSeparator()
         db_menu.addAction(add_files_action)
+        db_menu.addAction(extract_text_action)
         db_menu.addSeparator()
         db_menu.addAction(exit_action)
 
@@ -144,11 +197,146 @@ class MainWnd (QMainWindow):
         self.journal_list.createMenu(self.journal_menu)
 
     def openDatabase(self):
-        QMessageBox.information(self, "Open", "This function has not implemented yet.")
+        fn = QFileDialog.getOpenFileName(self, "Open library",
+            filter="pdfrog libraries (*.db);; All Files (*.*)")
+        if fn[0]:
+            self.openLibrary(fn[0])
+
+    def openLibrary(self, path):
+        """switches to library at path, keeping all widgets. Returns False if it failed"""
+        try:
+            engine = database.openEngine(path)
+        except sa.exc.DatabaseError as e:
+            QMessageBox.warning(self, "Open", "Could not open {0}:\n{1}".format(path, e))
+            return False
+        if not self.closeLibrary():
+            engine.dispose()
+            return False
+        database.useEngine(engine)
+        self.libraryOpened()
+        return True
+
+    def libraryOpened(self):
+        """starts background work on opened library, lists get filled once shown"""
+        self.writer = BackgroundWriter(pdfrog.session.bind,
+            report_failure=self.backgroundWritesFailed.emit)
+        self.writer.start()
+        self.autosave.start()
+        self.setWindowTitle("{0} - pdfrog[*]".format(os.path.basename(database.libraryPath())))
+        for widget in (self.article_list, self.author_list, self.tag_list, self.journal_list,
+                       self.issue_list):
+            widget.clearData()
+        self.unloaded_tabs = set(self.tab_searches)
+        self.loadTab(self.tab_widget.currentIndex())
+
+    def closeLibrary(self):
+        """stops background work and saves changes
+
+        Returns False, leaving library open, if changes couldn't be saved
+        and user didn't agree to discard them."""
+        self.autosave.stop()
+        if self.text_extract_thread is not None:
+            self.text_extract_thread.stop()
+            self.text_extract_thread.wait()
+        self.query_executor.stop()
+        # autosave leaves only changes of last few seconds to write
+        if not self.saveBeforeClosing():
+            self.autosave.start()
+            return False
+        if self.blob_gc_thread is not None:
+            self.blob_gc_thread.wait()
+        self.blob_gc_pending = False
+        self.writer.close()
+        return True
+
+    def attachLibrary(self, path):
+        """attaches library for searching, see database.attach. Returns its schema name"""
+        # session's next connection, opened after commit, gets library attached
+        self.autosave.save()
+        return database.attach(path)
+
+    def searchLibraries(self):
+        dialog = LibrarySearchDialog(self)
+        dialog.exec_()
+
+    def showArticle(self, article_id):
+        self.selectTab("articles")
+        self.article_search_bar.setText('id:{0}'.format(article_id))
+        self.articleSearchBarReturnPressed()
 
     def saveDatabase(self):
-        pdfrog.session.commit()
-        self.statusBar().showMessage('Saved')
+        if self.autosave.save():
+            self.statusBar().showMessage('Saved')
+
+    def saveStateChanged(self, dirty):
+        self.setWindowModified(dirty)
+        self.save_state_label.setText('Unsaved changes' if dirty else '')
+
+    def databaseSaved(self):
+        self.save_state_label.setText('Saved at ' + QTime.currentTime().toString())
+        self.collectGarbage()
+
+    def saveFailed(self, message):
+        self.save_state_label.setText('Unsaved changes, retrying')
+        self.statusBar().showMessage('Could not save: ' + message)
+
+    def changesLost(self, message):
+        QMessageBox.warning(self, "Save", "Changes could not be saved and were lost:\n" + message)
+
+    def showBackgroundWritesFailed(self, count, message):
+        QMessageBox.warning(self, "Save",
+            "{0} background write(s), e.g. extracted text, could not be saved " \
+            "and were dropped:\n{1}".format(count, message))
+
+    def saveBeforeClosing(self):
+        """saves changes, asking what to do if it fails. Returns False if user cancels"""
+        while not self.autosave.save():
+            if not self.autosave.dirty:
+                return True     # nothing left to save, changesLost told why
+            answer = QMessageBox.warning(self, "Save",
+                "Changes could not be saved:\n{0}".format(self.autosave.error),
+                QMessageBox.Retry | QMessageBox.Discard | QMessageBox.Cancel)
+            if answer == QMessageBox.Discard:
+                self.autosave.discard()
+            elif answer != QMessageBox.Retry:
+                return False
+        return True
+
+    def articlesDeleted(self, count):
+        self.autosave.save()
+        self.statusBar().showMessage('{} article(s) deleted'.format(count))
+
+    def collectGarbage(self):
+        """removes files of deleted articles in background. Call after commit"""
+        if self.blob_gc_thread is not None and self.blob_gc_thread.isRunning():
+            self.blob_gc_pending = True
+            return
+        self.blob_gc_pending = False
+        self.blob_gc_thread = BlobGarbageCollectThread(self)
+        self.blob_gc_thread.finished.connect(self.garbageCollected)
+        self.blob_gc_thread.start()
+
+    def garbageCollected(self):
+        if self.blob_gc_pending:
+            self.collectGarbage()
+
+    def extractText(self):
+        if self.text_extract_thread is not None and self.text_extract_thread.isRunning():
+            return
+        self.text_extract_count = 0
+        self.text_extract_thread = TextExtractThread(self)
+        self.text_extract_thread.batchReady.connect(self.textExtractBatchReady)
+        self.text_extract_thread.finished.connect(self.textExtractFinished)
+        self.text_extract_thread.start()
+        self.statusBar().showMessage('Extracting text ...')
+
+    def textExtractBatchReady(self, results):
+        self.writer.submit(lambda session: textextract.storeResults(session, results))
+        self.text_extract_count += len(results)
+        self.statusBar().showMessage('Extracting text: {} article(s) done'.format(self.text_extract_count))
+
+    def textExtractFinished(self):
+        self.statusBar().showMessage('Text extracted from {} article(s)'.format(self.text_extract_count))
 
     def tabCurrentPageChanged(self, index):
         # TODO: get rid of hardcoded tabwidget page order
@@ -158,12 +346,23 @@ class MainWnd (QMainWindow):
         self.author_menu.setEnabled(index == 1)
         self.tag_menu.setEnabled(index == 2)
         self.journal_menu.setEnabled(index == 3)
+        self.loadTab(index)
+
+    def loadTab(self, index):
+        """fills list of tab if it wasn't since library was opened"""
+        page = self.tab_widget.widget(index)
+        if page not in self.unloaded_tabs: return
+        self.unloaded_tabs.discard(page)
+        self.tab_searches[page]()
 
     def addFilesDialog(self):
         fl = QFileDialog.getOpenFileNames(self, filter="PDF documents (*.pdf);; All Files (*.*)", selectedFilter="*.pdf")
         self.addFiles(fl[0])
 
     def addFiles(self, filelist):
+        if len(filelist) > 1:
+            self.importFiles(filelist)
+            return
         total_documents = len(filelist)
         doc_idx = 1
         for filename in filelist:
@@ -175,13 +374,33 @@ class MainWnd (QMainWindow):
             doc_idx += 1
         self.article_list.refreshData()
 
+    def importFiles(self, filelist):
+        """adds files without asking for titles, showing one progress dialog"""
+        progress = QProgressDialog('Importing files ...', 'Cancel', 0, len(filelist), self)
+        progress.setWindowTitle('Import')
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+
+        def report(done, total, filename):
+            progress.setValue(done)
+            progress.setLabelText('Importing {0} of {1}:\n{2}'.format(done, total, filename))
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+
+        importer = BatchImport(filelist)
+        importer.run(report)
+        progress.setValue(len(filelist))
+        self.article_list.refreshData()
+        self.statusBar().showMessage('{0} article(s) added, {1} with already stored file, {2} failed'.\
+            format(importer.imported, importer.linked, len(importer.failed)))
+        if len(importer.failed) > 0:
+            QMessageBox.warning(self, 'Import', 'Failed to import:\n' + \
+                '\n'.join('{0}: {1}'.format(path, err) for (path, err) in importer.failed[:20]))
+
     def closeEvent(self, event):
-        from time import sleep
-        self.statusBar().showMessage('Saving changes to database (please wait) ...')
-        self.statusBar().repaint()
-        pdfrog.session.commit()
-        self.statusBar().showMessage('Saved')
-        self.statusBar().repaint()
+        if not self.closeLibrary():
+            event.ignore()
+            return
         QMainWindow.closeEvent(self, event)
 
     def dropEvent(self, event):
@@ -198,33 +417,27 @@ class MainWnd (QMainWindow):
     def dragMoveEvent(self, event):
         self.dragEnterEvent(event)
 
+    def runSearch(self, name, build, widget, what):
+        """runs query build(session) in background and shows results in widget
+
+        Worker counts results and loads their first page too."""
+        model = widget.model()
+        def work(session):
+            query = build(session)
+            return (query, query.count(), model.fetchPage(session, 0, query, [], {}))
+        def done(result, seconds):
+            (query, total, first_page) = result
+            widget.refreshData(query.with_session(pdfrog.session()), total, first_page)
+            self.statusBar().showMessage('{0} {1}(s), {2:.2f} s'.format(total, what, seconds))
+        def failed(message):
+            self.statusBar().showMessage('Search failed: ' + message)
+        self.statusBar().showMessage('Filtering {}s ...'.format(what))
+        self.query_executor.submit(name, work, done, failed)
+
     def articleSearchBarReturnPressed(self):
-        query_list = []
-        for keyword in shlex.split(self.article_search_bar.text()):
-            # shlex.split have some kind of difficulties with unicode
-            keyword = keyword.decode()
-            query = pdfrog.session.query(Article)
-            if keyword[0:4] == "tag:":
-                tagname = keyword[4:]
-                query = query.join(Article.tags).filter(Tag.name==tagname)
-            elif keyword[0:7] == "author:":
-                authorname = keyword[7:]
-                query = query.join(Article.authors).filter(Author.name.like('%'+authorname+'%'))
-            elif keyword[0:12] == "authorexact:":
-                authorname = keyword[12:]
-                query = query.join(Article.authors).filter(Author.name == authorname)
-            else:
-                likestr = '%' + keyword + '%'
-                query = query.filter(Article.title.like(likestr))
-            query_list.append(query)
-        # intersect queries
-        query = pdfrog.session.query(Article)
-        query = query.intersect(*query_list)
-
-        self.statusBar().showMessage('Filtering ...')
-        self.statusBar().repaint()
-        item_count = self.article_list.refreshData(query)
-        self.statusBar().showMessage('{} article(s)'.format(item_count))
+        text = self.article_search_bar.text()
+        self.runSearch('articles', lambda session: searchquery.articleQuery(text, session),
+            self.article_list, 'article')
 
     def findArticlesByAuthorName(self, authorname):
         self.selectTab("articles")
@@ -241,40 +454,32 @@ class MainWnd (QMainWindow):
             self.tab_widget.setCurrentIndex(2)
 
     def authorSearchBarReturnPressed(self):
-        self.statusBar().showMessage('Filtering authors...')
-        self.statusBar().repaint()
-        query_list = []
-        for keyword in shlex.split(self.author_search_bar.text()):
-            keyword = keyword.decode()
-            query = pdfrog.session.query(Author)
-            if keyword[0:4] == "org:":
-                query = query.filter(Author.organization.like("%{}%".format(keyword[4:])))
-            elif keyword[0:9] == "orgexact:":
-                query = query.filter(Author.organization == keyword[9:])
-            elif keyword[0:4] == "tag:":
-                query = query.join(Author.articles).join(Article.tags)
-                query = query.filter(Tag.name==keyword[4:])
-            else:
-                query = query.filter(Author.name.like("%{}%".format(keyword)))
-            query_list.append(query)
-
-        query = pdfrog.session.query(Author).intersect(*query_list)
-        item_count = self.author_list.refreshData(query)
-        self.statusBar().showMessage('{} author(s)'.format(item_count))
+        text = self.author_search_bar.text()
+        self.runSearch('authors', lambda session: searchquery.authorQuery(text, session),
+            self.author_list, 'author')
 
     def tagSearchBarReturnPressed(self):
-        self.statusBar().showMessage('Filtering tags...')
-        self.statusBar().repaint()
-        query_list = []
-        for keyword in shlex.split(self.tag_search_bar.text()):
-            keyword = keyword.decode()
-            query = pdfrog.session.query(Tag)
-            query = query.filter(Tag.name.like("%{}%".format(keyword)))
-            query_list.append(query)
-
-        query = pdfrog.session.query(Tag).intersect(*query_list)
-        item_count = self.tag_list.refreshData(query)
-        self.statusBar().showMessage('{} tag(s)'.format(item_count))
+        text = self.tag_search_bar.text()
+        self.runSearch('tags', lambda session: searchquery.tagQuery(text, session),
+            self.tag_list, 'tag')
 
     def journalSearchBarReturnPressed(self):
-        print "stub journalSearchBarReturnPressed"
+        text = self.journal_search_bar.text()
+        self.runSearch('journals', lambda session: searchquery.journalQuery(text, session),
+            self.journal_list, 'journal')
+
+    def findArticlesByJournal(self, journal_id):
+        self.selectTab("articles")
+        self.article_search_bar.setText('journalid:{0}'.format(journal_id))
+        self.articleSearchBarReturnPressed()
+
+    def findArticlesByIssue(self, issue_id):
+        self.selectTab("articles")
+        self.article_search_bar.setText('issueid:{0}'.format(issue_id))
+        self.articleSearchBarReturnPressed()
+
+    def findIssuesByJournal(self, journal_id):
+        # year: of journal filter applies to issues as well
+        text = 'journalid:{0} {1}'.format(journal_id, self.journal_search_bar.text())
+        self.runSearch('issues', lambda session: searchquery.issueQuery(text, session),
+            self.issue_list, 'issue')
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/migrate.py
+# Upgrades database files created by older versions. Steps are applied
+# once, in order; number of the last applied step is kept in sqlite's
+# user_version pragma. Up-to-date database isn't checked any further (see
+# database.openEngine), so a new table needs a step as well, even if the
+# step itself has nothing to do: tables are created before steps are run.
+# Full-text index is the exception: whether it can exist depends on sqlite
+# library, not on file, so it's checked on every open (syncFulltextIndex).
+from pdfrog.datamodel import FileBlob, rebuildCounters, rebuildNames, \
+    articleAuthorNamesSql, articleTagNamesSql
+from pdfrog import fulltext
+import sqlalchemy as sa
+import hashlib
+
+
+def _columnNames(conn, table):
+    return [row[1] for row in conn.execute('PRAGMA table_info({})'.format(table))]
+
+def _moveBlobsToChunkTable(conn, batch_size=16):
+    """moves articles.fileblob contents to fileblob_chunks table
+
+    Data is copied by INSERT ... SELECT substr(), so it never passes through
+    python and memory use doesn't depend on file sizes."""
+    if 'fileblob' not in _columnNames(conn, 'articles'): return
+    if 'blob_id' not in _columnNames(conn, 'articles'):
+        conn.execute('ALTER TABLE articles ADD COLUMN blob_id INTEGER REFERENCES fileblobs(id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_articles_blob_id ON articles (blob_id)')
+    while True:
+        trans = conn.begin()
+        rows = conn.execute('SELECT id, length(fileblob) FROM articles ' \
+            'WHERE fileblob IS NOT NULL LIMIT ?', batch_size).fetchall()
+        for (article_id, size) in rows:
+            blob_id = conn.execute('INSERT INTO fileblobs (size) VALUES (?)', size).lastrowid
+            for seq, offset in enumerate(range(0, size, FileBlob.CHUNK_SIZE)):
+                conn.execute('INSERT INTO fileblob_chunks (blob_id, seq, data) ' \
+                    'SELECT ?, ?, substr(fileblob, ?, ?) FROM articles WHERE id = ?',
+                    blob_id, seq, offset + 1, FileBlob.CHUNK_SIZE, article_id)
+            conn.execute('UPDATE articles SET blob_id = ?, fileblob = NULL WHERE id = ?',
+                blob_id, article_id)
+        trans.commit()
+        if len(rows) < batch_size: break
+
+def _addBlobDigests(conn):
+    """makes blob storage content-addressed and reference-counted"""
+    columns = _columnNames(conn, 'fileblobs')
+    if 'digest' not in columns:
+        conn.execute('ALTER TABLE fileblobs ADD COLUMN digest VARCHAR')
+    if 'refcount' not in columns:
+        conn.execute('ALTER TABLE fileblobs ADD COLUMN refcount INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_fileblobs_refcount ON fileblobs (refcount)')
+
+    trans = conn.begin()
+    blob_ids = [row[0] for row in conn.execute('SELECT id FROM fileblobs WHERE digest IS NULL')]
+    for blob_id in blob_ids:
+        h = hashlib.sha256()
+        for (data,) in conn.execute('SELECT data FROM fileblob_chunks ' \
+                'WHERE blob_id = ? ORDER BY seq', blob_id):
+            h.update(data)
+        digest = h.hexdigest()
+        same_id = conn.execute('SELECT id FROM fileblobs WHERE digest = ?', digest).scalar()
+        if same_id is None:
+            conn.execute('UPDATE fileblobs SET digest = ? WHERE id = ?', digest, blob_id)
+        else:
+            # contents are already stored, keep only one copy
+            conn.execute('UPDATE articles SET blob_id = ? WHERE blob_id = ?', same_id, blob_id)
+            conn.execute('DELETE FROM fileblob_chunks WHERE blob_id = ?', blob_id)
+            conn.execute('DELETE FROM fileblobs WHERE id = ?', blob_id)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_fileblobs_digest ON fileblobs (digest)')
+
+    conn.execute('UPDATE fileblobs SET refcount = ' \
+        '(SELECT count(*) FROM articles WHERE blob_id = fileblobs.id)')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS fileblobs_ref_insert AFTER INSERT ON articles
+        WHEN new.blob_id IS NOT NULL BEGIN
+            UPDATE fileblobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+        END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS fileblobs_ref_delete AFTER DELETE ON articles
+        WHEN old.blob_id IS NOT NULL BEGIN
+            UPDATE fileblobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+        END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS fileblobs_ref_update AFTER UPDATE OF blob_id ON articles
+        BEGIN
+            UPDATE fileblobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+            UPDATE fileblobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+        END''')
+    trans.commit()
+
+def _addBlobCodec(conn):
+    if 'codec' not in _columnNames(conn, 'fileblobs'):
+        conn.execute('ALTER TABLE fileblobs ADD COLUMN codec VARCHAR')
+
+FULLTEXT_TRIGGERS = ('articles_fts_insert', 'articles_fts_delete', 'articles_fts_update')
+
+def _createFulltextIndex(conn):
+    """creates FTS5 index over article texts, if sqlite supports it
+
+    Done again by syncFulltextIndex() whenever database is opened, as the
+    same file may be used with sqlite with and without FTS5."""
+    _syncFulltextIndex(conn)
+
+def _syncFulltextIndex(conn):
+    names = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master " \
+        "WHERE name IN ('articles_fts', {0})".format(
+            ', '.join("'{0}'".format(name) for name in FULLTEXT_TRIGGERS))))
+    if not fulltext.supported():
+        # triggers would make every change of articles fail with "no such
+        # module"; index gets rebuilt once file is opened with FTS5 again
+        present = [name for name in FULLTEXT_TRIGGERS if name in names]
+        if present:
+            trans = conn.begin()
+            for name in present:
+                conn.execute('DROP TRIGGER {0}'.format(name))
+            trans.commit()
+        return
+    if names == set(('articles_fts',) + FULLTEXT_TRIGGERS):
+        return      # index is kept up to date
+    trans = conn.begin()
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(" \
+        "title, keywords, abstract, plaintext, " \
+        "content='articles', content_rowid='id', prefix='2 3')")
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles
+        BEGIN
+            INSERT INTO articles_fts (rowid, title, keywords, abstract, plaintext)
+                VALUES (new.id, new.title, new.keywords, new.abstract, new.plaintext);
+        END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, keywords, abstract, plaintext)
+                VALUES ('delete', old.id, old.title, old.keywords, old.abstract, old.plaintext);
+        END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS articles_fts_update
+        AFTER UPDATE OF title, keywords, abstract, plaintext ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, keywords, abstract, plaintext)
+                VALUES ('delete', old.id, old.title, old.keywords, old.abstract, old.plaintext);
+            INSERT INTO articles_fts (rowid, title, keywords, abstract, plaintext)
+                VALUES (new.id, new.title, new.keywords, new.abstract, new.plaintext);
+        END''')
+    # articles may have changed while triggers were missing
+    conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+    trans.commit()
+
+def syncFulltextIndex(engine):
+    """creates or rebuilds FTS5 index if sqlite supports it, drops its
+    triggers if not. Costs one look at schema when nothing is to be done"""
+    conn = engine.connect()
+    try:
+        _syncFulltextIndex(conn)
+    finally:
+        conn.close()
+
+def _addTextStatus(conn):
+    if 'textstatus' not in _columnNames(conn, 'articles'):
+        conn.execute('ALTER TABLE articles ADD COLUMN textstatus VARCHAR')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_articles_textstatus ON articles (textstatus)')
+
+def _addUsageCounters(conn):
+    """adds article_tags.usage_count and authors.article_count"""
+    if 'usage_count' not in _columnNames(conn, 'article_tags'):
+        conn.execute('ALTER TABLE article_tags ADD COLUMN usage_count INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_article_tags_usage_count ON article_tags (usage_count)')
+    if 'article_count' not in _columnNames(conn, 'authors'):
+        conn.execute('ALTER TABLE authors ADD COLUMN article_count INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_authors_article_count ON authors (article_count)')
+    trans = conn.begin()
+    for (pairs, counted, key, counter) in [
+            ('article_tag_pairs', 'article_tags', 'tag_id', 'usage_count'),
+            ('author_article_pairs', 'authors', 'author_id', 'article_count')]:
+        names = dict(pairs=pairs, counted=counted, key=key, counter=counter)
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_count_insert AFTER INSERT ON {pairs}
+            BEGIN
+                UPDATE {counted} SET {counter} = {counter} + 1 WHERE id = new.{key};
+            END'''.format(**names))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_count_delete AFTER DELETE ON {pairs}
+            BEGIN
+                UPDATE {counted} SET {counter} = {counter} - 1 WHERE id = old.{key};
+            END'''.format(**names))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_count_update AFTER UPDATE OF {key} ON {pairs}
+            BEGIN
+                UPDATE {counted} SET {counter} = {counter} - 1 WHERE id = old.{key};
+                UPDATE {counted} SET {counter} = {counter} + 1 WHERE id = new.{key};
+            END'''.format(**names))
+    rebuildCounters(conn)
+    trans.commit()
+
+def _addAuthorTagSummary(conn):
+    """fills author_article_tags and sets triggers to keep it up to date"""
+    trans = conn.begin()
+    for (pairs, other, key, other_key) in [
+            ('article_tag_pairs', 'author_article_pairs', 'tag_id', 'author_id'),
+            ('author_article_pairs', 'article_tag_pairs', 'author_id', 'tag_id')]:
+        names = dict(pairs=pairs, other=other, key=key, other_key=other_key)
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_summary_insert AFTER INSERT ON {pairs}
+            BEGIN
+                INSERT OR IGNORE INTO author_article_tags ({key}, {other_key}, article_count)
+                    SELECT new.{key}, {other_key}, 0 FROM {other} WHERE article_id = new.article_id;
+                UPDATE author_article_tags SET article_count = article_count + 1
+                    WHERE {key} = new.{key} AND {other_key} IN
+                        (SELECT {other_key} FROM {other} WHERE article_id = new.article_id);
+            END'''.format(**names))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_summary_delete AFTER DELETE ON {pairs}
+            BEGIN
+                UPDATE author_article_tags SET article_count = article_count - 1
+                    WHERE {key} = old.{key} AND {other_key} IN
+                        (SELECT {other_key} FROM {other} WHERE article_id = old.article_id);
+                DELETE FROM author_article_tags WHERE {key} = old.{key} AND article_count <= 0;
+            END'''.format(**names))
+    rebuildCounters(conn)
+    trans.commit()
+
+def _addSortIndexes(conn):
+    """indexes columns list views are sorted by"""
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_authors_organization ON authors (organization)')
+
+def _addUniqueTagPairs(conn):
+    """drops duplicate article-tag pairs and forbids new ones"""
+    trans = conn.begin()
+    conn.execute('DELETE FROM article_tag_pairs WHERE rowid NOT IN '
+        '(SELECT min(rowid) FROM article_tag_pairs GROUP BY article_id, tag_id)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_article_tag_pairs '
+        'ON article_tag_pairs (article_id, tag_id)')
+    rebuildCounters(conn)
+    trans.commit()
+
+def _addJournalIndexes(conn):
+    """indexes links from articles to issues and from issues to journals"""
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_articles_j_issue_id ON articles (j_issue_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_journalissues_journal_id ON journalissues (journal_id)')
+
+def _addArticleNames(conn):
+    """adds Article.author_names and Article.tag_names, sets triggers to keep them"""
+    for column in ('author_names', 'tag_names'):
+        if column not in _columnNames(conn, 'articles'):
+            conn.execute('ALTER TABLE articles ADD COLUMN {0} VARCHAR'.format(column))
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_articles_{0} ON articles ({0})'.format(column))
+    trans = conn.begin()
+    for (pairs, named, key, column, expr) in [
+            ('author_article_pairs', 'authors', 'author_id', 'author_names', articleAuthorNamesSql),
+            ('article_tag_pairs', 'article_tags', 'tag_id', 'tag_names', articleTagNamesSql)]:
+        names = dict(pairs=pairs, named=named, key=key, column=column,
+            new=expr('new.article_id'), old=expr('old.article_id'), all=expr('articles.id'))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_names_insert AFTER INSERT ON {pairs}
+            BEGIN
+                UPDATE articles SET {column} = {new} WHERE id = new.article_id;
+            END'''.format(**names))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {pairs}_names_delete AFTER DELETE ON {pairs}
+            BEGIN
+                UPDATE articles SET {column} = {old} WHERE id = old.article_id;
+            END'''.format(**names))
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS {named}_names_update AFTER UPDATE OF name ON {named}
+            BEGIN
+                UPDATE articles SET {column} = {all}
+                    WHERE id IN (SELECT article_id FROM {pairs} WHERE {key} = new.id);
+            END'''.format(**names))
+    rebuildNames(conn)
+    trans.commit()
+
+steps = [
+    _moveBlobsToChunkTable,
+    _addBlobDigests,
+    _addBlobCodec,
+    _createFulltextIndex,
+    _addTextStatus,
+    _addUsageCounters,
+    _addAuthorTagSummary,
+    _addSortIndexes,
+    _addUniqueTagPairs,
+    _addJournalIndexes,
+    _addArticleNames,
+]
+
+def pending(engine):
+    """True if database lacks some steps (or is new and empty)"""
+    conn = engine.connect()
+    try:
+        return conn.execute('PRAGMA user_version').scalar() < len(steps)
+    finally:
+        conn.close()
+
+def upgrade(engine):
+    """applies steps not yet applied to database"""
+    conn = engine.connect()
+    try:
+        version = conn.execute('PRAGMA user_version').scalar()
+        for number, step in enumerate(steps[version:], version + 1):
+            step(conn)
+            conn.execute('PRAGMA user_version = {}'.format(number))
+    finally:
+        conn.close()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/pagedmodel.py
+from PySide.QtCore import *
+import sqlalchemy as sa
+import pdfrog
+from pdfrog.querythread import QueryExecutor
+
+def rowRanges(rows):
+    """splits row numbers into sorted (first, last) ranges of adjacent rows"""
+    ranges = []
+    for row in sorted(set(rows)):
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
+
+def queryOrder(query):
+    """(expression, descending) pairs of query's own ORDER BY"""
+    keys = []
+    for clause in query._order_by or ():
+        modifier = getattr(clause, 'modifier', None)
+        if modifier is sa.sql.operators.desc_op:
+            keys.append((clause.element, True))
+        elif modifier is sa.sql.operators.asc_op:
+            keys.append((clause.element, False))
+        else:
+            keys.append((clause, False))
+    return keys
+
+def adopt(session, obj):
+    """object of session for obj loaded by another (worker's) session
+
+    Object session already has is returned as it is, keeping user's edits."""
+    key = sa.inspect(obj).key
+    existing = session.identity_map.get(key)
+    if existing is not None:
+        return existing
+    return session.merge(obj, load=False)
+
+class PagedQueryModel(QAbstractTableModel):
+    """table model showing results of a query, loaded by pages
+
+    Model knows total number of results, but reports only rows fetched so
+    far; view asks for more with fetchMore() while being scrolled. Pages
+    are loaded in background by executor and merged into pdfrog.session;
+    rows show empty until their page arrives. item() used by actions on
+    selected rows loads missing page right away. Objects are kept only for
+    MAX_PAGES recently used pages, others are dropped and loaded again when
+    needed, so memory use doesn't grow with result size.
+    Results are ordered by query's own order, or by sort keys set with
+    sortQuery(), then by id_column. Page is located by these keys of the
+    last row of previous page (keyset pagination), so loading it costs an
+    index seek instead of skipping all preceding rows. When previous page
+    was never loaded (view scrolled far at once), rows in between are
+    stepped over reading only their keys, and keys of every page passed
+    are noted, so each of them is located by a seek later."""
+    PAGE_SIZE = 100
+    MAX_PAGES = 10
+
+    def __init__(self, id_column, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.id_column = id_column
+        # main window gives its own, which saves pending changes first
+        self.executor = QueryExecutor(self)
+        self.query = None
+        self.total = 0
+        self.fetched = 0
+        self.pages = {}
+        self.page_use = []      # page numbers, most recently used last
+        self.loading = set()    # pages being loaded in background
+        self.wanted = set()     # pages to be requested once control returns to event loop
+        self.sort_keys = []     # (expression, descending) pairs
+        self.page_keys = {}     # page number: keys of row preceding it
+
+    def setQuery(self, query, total=None, first_page=None):
+        """shows results of query in its own order, returns their count
+
+        total and first_page (fetchPage() result for page 0) are given when
+        caller's worker has loaded them; otherwise they are loaded in
+        background. Sort keys set by sortQuery() are dropped: e.g. full-text
+        search orders by relevance."""
+        self.beginResetModel()
+        self.executor.cancel((self, 'count'))
+        self.query = query
+        self.total = total or 0
+        self.fetched = 0
+        self.dropPages()
+        self.sort_keys = []
+        self.page_keys = {}
+        self.endResetModel()
+        if first_page is not None:
+            self.pageLoaded(0, *first_page)
+        if query is not None and total is None:
+            self.requestCount()
+        return self.total
+
+    def requestCount(self):
+        """counts results and loads their first page in background"""
+        query = self.query
+        def work(session):
+            return (query.with_session(session).count(), self.fetchPage(session, 0, query, [], {}))
+        def counted(result, seconds):
+            (total, first_page) = result
+            self.setQuery(query, total, first_page)
+        self.executor.submit((self, 'count'), work, counted)
+
+    def dropPages(self, first_row=0):
+        """forgets loaded objects of rows starting with first_row"""
+        first_page = first_row // self.PAGE_SIZE
+        for page in [p for p in self.pages if p >= first_page]:
+            del self.pages[page]
+            self.page_use.remove(page)
+        # pages being loaded may be numbered by rows no longer there
+        for page in self.loading:
+            self.executor.cancel((self, page))
+        self.loading = set()
+        self.wanted = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return self.fetched
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.fetched < self.total
+
+    def fetchMore(self, parent):
+        count = min(self.PAGE_SIZE, self.total - self.fetched)
+        if parent.isValid() or count <= 0: return
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def item(self, row):
+        """object in row, its page is loaded right away if needed"""
+        (page, offset) = divmod(row, self.PAGE_SIZE)
+        if page not in self.pages:
+            self.pageLoaded(page, *self.fetchPage(pdfrog.session(), page,
+                self.query, self.sort_keys, self.page_keys))
+        return self.page(page)[offset]
+
+    def shownItem(self, row):
+        """object in row, None while its page is being loaded in background"""
+        (page, offset) = divmod(row, self.PAGE_SIZE)
+        if page not in self.pages:
+            self.requestPage(page)
+            return None
+        items = self.page(page)
+        return items[offset] if offset < len(items) else None
+
+    def page(self, page):
+        self.page_use.remove(page)
+        self.page_use.append(page)
+        return self.pages[page]
+
+    def requestPage(self, page):
+        """loads page in background
+
+        Request is sent from event loop, not from data() painting the view:
+        executor may save pending changes first, which can show a message."""
+        if page in self.loading or page in self.wanted: return
+        if not self.wanted:
+            QTimer.singleShot(0, self.loadWantedPages)
+        self.wanted.add(page)
+
+    def loadWantedPages(self):
+        (query, sort_keys, page_keys) = (self.query, list(self.sort_keys), dict(self.page_keys))
+        for page in self.wanted - set(self.pages):
+            def work(session, page=page):
+                return self.fetchPage(session, page, query, sort_keys, page_keys)
+            def loaded(result, seconds, page=page):
+                self.loading.discard(page)
+                self.pageLoaded(page, *result)
+            # failed page stays in self.loading, so it isn't retried until results change
+            self.loading.add(page)
+            self.executor.submit((self, page), work, loaded)
+        self.wanted = set()
+
+    def pageLoaded(self, page, items, page_keys, extra):
+        """takes page loaded by fetchPage(), possibly in another thread"""
+        session = pdfrog.session()
+        self.pages[page] = [adopt(session, item) for item in items]
+        self.page_keys.update(page_keys)
+        self.addExtra(extra)
+        if page in self.page_use:
+            self.page_use.remove(page)
+        elif len(self.page_use) >= self.MAX_PAGES:
+            del self.pages[self.page_use.pop(0)]
+        self.page_use.append(page)
+        first = page * self.PAGE_SIZE
+        last = min(first + self.PAGE_SIZE, self.fetched) - 1
+        if last >= first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1))
+
+    def fetchExtra(self, items):
+        """loads data shown along with items of a page, in the same thread"""
+        return None
+
+    def addExtra(self, extra):
+        """takes what fetchExtra() returned"""
+        pass
+
+    def orderKeys(self, query, sort_keys):
+        """(expression, descending) pairs results are ordered by"""
+        keys = sort_keys or queryOrder(query)
+        return keys + [(self.id_column, False)]
+
+    def orderedBy(self, query, keys):
+        return query.order_by(*[expr.desc() if desc else expr for (expr, desc) in keys])
+
+    def fetchPage(self, session, page, query, sort_keys, page_keys):
+        """loads page of query results with session, in any thread
+
+        Returns (objects, keys of pages found, fetchExtra() result); only
+        reads its arguments, model is changed by pageLoaded()."""
+        query = query.with_session(session)
+        keys = self.orderKeys(query, sort_keys)
+        found = {}
+        rows_query = self.orderedBy(query.order_by(None).\
+            add_columns(*[expr for (expr, desc) in keys]), keys)
+        if page > 0:
+            previous = page_keys.get(page)
+            if previous is None:
+                found = self.keysBefore(page, query, keys, page_keys)
+                previous = found.get(page)
+            if previous is None:        # results got shorter
+                return ([], found, self.fetchExtra([]))
+            rows_query = rows_query.filter(self.rowsAfter(keys, previous))
+        rows = rows_query.limit(self.PAGE_SIZE).all()
+        if len(rows) == self.PAGE_SIZE:
+            found[page + 1] = tuple(rows[-1][1:])
+        items = [row[0] for row in rows]
+        return (items, found, self.fetchExtra(items))
+
+    def keysBefore(self, page, query, keys, page_keys):
+        """{page number: keys of row preceding it} for pages up to page
+
+        Steps from the nearest page with known keys, reading keys only."""
+        start = max([p for p in page_keys if p <= page] or [0])
+        keys_query = self.orderedBy(query.order_by(None).\
+            with_entities(*[expr for (expr, desc) in keys]), keys)
+        if start > 0:
+            keys_query = keys_query.filter(self.rowsAfter(keys, page_keys[start]))
+        found = {}
+        for (number, row) in enumerate(keys_query.limit((page - start) * self.PAGE_SIZE), 1):
+            if number % self.PAGE_SIZE == 0:
+                found[start + number // self.PAGE_SIZE] = tuple(row)
+        return found
+
+    @staticmethod
+    def rowsAfter(keys, values):
+        """condition on rows following one with sort key values
+
+        SQLite puts NULLs first in ascending order and last in descending."""
+        ((expr, desc), value) = (keys[-1], values[-1])
+        condition = expr > value        # id_column, never NULL
+        for ((expr, desc), value) in reversed(list(zip(keys[:-1], values[:-1]))):
+            if value is None:
+                equal = expr.is_(None)
+                after = sa.false() if desc else expr.isnot(None)
+            else:
+                equal = expr == value
+                after = sa.or_(expr < value, expr.is_(None)) if desc else expr > value
+            condition = sa.or_(after, sa.and_(equal, condition))
+        return condition
+
+    def removeItemRows(self, rows):
+        """removes rows of already deleted items, one signal per contiguous range"""
+        ranges = rowRanges(rows)
+        if not ranges: return
+        self.dropPages(ranges[0][0])
+        for page in [p for p in self.page_keys if p > ranges[0][0] // self.PAGE_SIZE]:
+            del self.page_keys[page]
+        for (first, last) in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.total -= last - first + 1
+            self.fetched -= last - first + 1
+            self.endRemoveRows()
+
+    def rowsChanged(self, rows):
+        """tells views that whole rows changed, one signal per contiguous range"""
+        for (first, last) in rowRanges(rows):
+            self.dataChanged.emit(self.index(first, 0),
+                self.index(last, self.columnCount() - 1))
+
+    def sortQuery(self, sort_keys):
+        """orders results by sort_keys, list of (expression, descending) pairs
+
+        Expressions should be indexed columns, so that ordering and locating
+        pages doesn't need to sort whole result set."""
+        self.layoutAboutToBeChanged.emit()
+        self.sort_keys = list(sort_keys)
+        self.dropPages()
+        self.page_keys = {}
+        self.layoutChanged.emit()
+
+    def clearData(self):
+        self.setQuery(None)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/prefixindex.py
+# In-memory indexes for search-as-you-type over tag and author names.
+# Name matches when typed text (case-insensitive) is a prefix of any of its
+# words or of the tail starting at that word, so "smi" and "john sm" both
+# find "John Smith". Indexes are loaded from committed data on first use.
+# Mapper events, which may fire on worker threads, note changes of names
+# in session being flushed; they are applied to indexes when that session
+# commits and forgotten when it rolls back.
+import bisect
+import re
+import threading
+import sqlalchemy as sa
+import pdfrog
+from pdfrog.datamodel import Tag, Author
+
+_word_start = re.compile(r'\w+', re.UNICODE)
+
+class PrefixIndex(object):
+    """sorted array of (name tail, name) pairs searched with bisect"""
+    def __init__(self, names=()):
+        self.lock = threading.RLock()
+        self.names = sorted(set(name for name in names if name))
+        self.entries = sorted((tail, name) for name in self.names for tail in self.tails(name))
+
+    @staticmethod
+    def tails(name):
+        lowered = name.lower()
+        return set(lowered[m.start():] for m in _word_start.finditer(lowered)) or set([lowered])
+
+    def add(self, name):
+        if not name: return
+        with self.lock:
+            pos = bisect.bisect_left(self.names, name)
+            if pos < len(self.names) and self.names[pos] == name: return
+            self.names.insert(pos, name)
+            for tail in self.tails(name):
+                bisect.insort(self.entries, (tail, name))
+
+    def remove(self, name):
+        if not name: return
+        with self.lock:
+            pos = bisect.bisect_left(self.names, name)
+            if pos == len(self.names) or self.names[pos] != name: return
+            del self.names[pos]
+            for tail in self.tails(name):
+                pos = bisect.bisect_left(self.entries, (tail, name))
+                if pos < len(self.entries) and self.entries[pos] == (tail, name):
+                    del self.entries[pos]
+
+    def rename(self, old_name, new_name):
+        with self.lock:
+            self.remove(old_name)
+            self.add(new_name)
+
+    def search(self, text, limit=300):
+        """names matching text, sorted; at most limit of them"""
+        prefix = text.lower()
+        with self.lock:
+            if prefix == '':
+                return self.names[:limit]
+            found = set()
+            pos = bisect.bisect_left(self.entries, (prefix,))
+            while pos < len(self.entries) and len(found) < limit:
+                (tail, name) = self.entries[pos]
+                if not tail.startswith(prefix): break
+                found.add(name)
+                pos += 1
+        return sorted(found)
+
+
+_indexes = {}       # mapped class: its PrefixIndex
+
+def nameIndex(cls):
+    """PrefixIndex over names of Tag or Author, loaded on first use"""
+    if cls not in _indexes:
+        # separate session doesn't see changes current one may roll back
+        session = pdfrog.session.session_factory()
+        try:
+            _indexes[cls] = PrefixIndex(row[0] for row in session.query(cls.name))
+        finally:
+            session.close()
+    return _indexes[cls]
+
+def reset():
+    """forgets all indexes, e.g. when another database is opened"""
+    _indexes.clear()
+
+def tagNames():
+    return nameIndex(Tag)
+
+def authorNames():
+    return nameIndex(Author)
+
+
+def _changes(target):
+    """(class, old name, new name) changes noted in target's session"""
+    return sa.orm.object_session(target).info.setdefault('name_changes', [])
+
+def _inserted(mapper, connection, target):
+    _changes(target).append((type(target), None, target.name))
+
+def _updated(mapper, connection, target):
+    history = sa.orm.attributes.get_history(target, 'name')
+    if history.deleted or history.added:
+        old_name = history.deleted[0] if history.deleted else None
+        _changes(target).append((type(target), old_name, target.name))
+
+def _deleted(mapper, connection, target):
+    _changes(target).append((type(target), target.name, None))
+
+for cls in (Tag, Author):
+    sa.event.listen(cls, 'after_insert', _inserted)
+    sa.event.listen(cls, 'after_update', _updated)
+    sa.event.listen(cls, 'after_delete', _deleted)
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+def _committed(session):
+    for (cls, old_name, new_name) in session.info.pop('name_changes', ()):
+        if cls in _indexes:
+            _indexes[cls].rename(old_name, new_name)
+
+@sa.event.listens_for(sa.orm.Session, 'after_rollback')
+def _rolledBack(session):
+    session.info.pop('name_changes', None)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/querythread.py
+# Runs list queries off the GUI thread. Worker builds query with its own
+# session, counts results and loads first page of them; the GUI gets rows
+# through a signal and merges them into its session, later pages are
+# loaded the same way while list is scrolled (see pagedmodel.py). New
+# request for same list interrupts previous one.
+import threading
+import time
+from PySide.QtCore import *
+import pdfrog
+from pdfrog import database
+
+class QueryThread(QThread):
+    """runs work(session) with a session of its own, emits what it returns"""
+    done = Signal(object, float)    # result of work, seconds spent
+    failed = Signal(str)
+
+    def __init__(self, work, parent=None):
+        QThread.__init__(self, parent)
+        self.work = work
+        self.connection = None      # raw sqlite connection while query runs
+        self.lock = threading.Lock()    # keeps connection open while cancel() uses it
+        self.cancelled = False
+
+    def run(self):
+        started = time.time()
+        try:
+            with database.unitOfWork() as session:
+                with self.lock:
+                    self.connection = session.connection().connection.connection
+                try:
+                    if self.cancelled: return
+                    result = self.work(session)
+                finally:
+                    # before unitOfWork closes the connection
+                    with self.lock:
+                        self.connection = None
+        except Exception as e:
+            # interrupt() makes query fail with OperationalError
+            if not self.cancelled:
+                self.failed.emit(str(e))
+            return
+        if not self.cancelled:
+            self.done.emit(result, time.time() - started)
+
+    def cancel(self):
+        self.cancelled = True
+        with self.lock:
+            if self.connection is not None:
+                self.connection.interrupt()
+
+
+class QueryExecutor(QObject):
+    """runs queries in background, one running request per name
+
+    work(session) runs in worker thread; callback(result, seconds) gets
+    what it returned in GUI thread, only for the latest request of a name;
+    errback(message), if given, when database reports an error. Objects
+    loaded by worker are detached, see pagedmodel.adopt(). Worker sees only
+    committed data, so save(), e.g. AutoSave.save, is called first while
+    pdfrog.session has uncommitted changes; if it fails, query runs on data
+    committed so far."""
+    def __init__(self, parent=None, save=None):
+        QObject.__init__(self, parent)
+        self.save = save
+        self.current = {}       # request name: running QueryThread
+        self.threads = []
+
+    def submit(self, name, work, callback, errback=None):
+        self.cancel(name)
+        if self.save is not None and database.hasUncommittedChanges(pdfrog.session):
+            self.save()
+        thread = QueryThread(work, self)
+        self.current[name] = thread
+        self.threads.append(thread)
+
+        def done(result, seconds):
+            if self.current.get(name) is thread:
+                del self.current[name]
+                callback(result, seconds)
+
+        def failed(message):
+            if self.current.get(name) is thread:
+                del self.current[name]
+                if errback is not None: errback(message)
+        thread.done.connect(done)
+        thread.failed.connect(failed)
+        thread.finished.connect(lambda: self.threads.remove(thread))
+        thread.start()
+
+    def cancel(self, name):
+        thread = self.current.pop(name, None)
+        if thread is not None:
+            thread.cancel()
+
+    def stop(self):
+        """cancels everything and waits for threads to exit"""
+        for name in list(self.current):
+            self.cancel(name)
+        for thread in list(self.threads):
+            thread.wait()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/searchquery.py
+# Turns search bar text into queries. Text is split like shell words, so
+# phrases with spaces should be quoted: author:"John Smith"
+#
+# Every keyword becomes a term and all terms go into one SELECT. Terms over
+# pair tables are ordered by estimated number of matching rows: the most
+# selective one is a `id IN (...)` subquery sqlite starts from, the rest
+# are EXISTS checks on rows it found. A term known to match nothing makes
+# whole query empty without running it.
+import shlex
+import sys
+import sqlalchemy as sa
+import pdfrog
+from pdfrog.datamodel import Article, Author, Tag, Journal, JournalIssue, \
+    author_article_pairs, article_tag_pairs, author_article_tags
+from pdfrog import fulltext
+
+def keywords(text):
+    """splits search text into keywords"""
+    # shlex.split have some kind of difficulties with unicode
+    if sys.version_info < (3, 0) and isinstance(text, unicode):
+        text = text.encode('utf-8')
+    for keyword in shlex.split(text):
+        if isinstance(keyword, bytes):
+            keyword = keyword.decode('utf-8')
+        yield keyword
+
+
+class Term(object):
+    """search condition
+
+    Either rows of pair table (column holds id of searched object, where
+    selects rows), or plain expr over searched table itself. estimate is
+    expected number of matches, None if unknown."""
+    def __init__(self, column=None, where=None, expr=None, estimate=None):
+        self.column = column
+        self.where = where
+        self.expr = expr
+        self.estimate = estimate
+
+    @classmethod
+    def counted(self, session, column, where):
+        """pair table term with estimate taken from index"""
+        estimate = session.query(sa.func.count()).\
+            select_from(column.table).filter(where).scalar()
+        return Term(column=column, where=where, estimate=estimate)
+
+    def membership(self, id_column):
+        return id_column.in_(sa.select([self.column]).where(self.where))
+
+    def check(self, id_column):
+        return sa.exists().where(sa.and_(self.where, self.column == id_column))
+
+
+def compileTerms(query, id_column, terms):
+    """applies terms to query, most selective first"""
+    unknown = sys.maxsize
+    terms = sorted(terms, key=lambda t: unknown if t.estimate is None else t.estimate)
+    if any(t.estimate == 0 for t in terms):
+        return query.filter(sa.false())
+    driver_used = False
+    for term in terms:
+        if term.expr is not None:
+            query = query.filter(term.expr)
+        elif not driver_used:
+            query = query.filter(term.membership(id_column))
+            driver_used = True
+        else:
+            query = query.filter(term.check(id_column))
+    return query
+
+def _tagId(session, name):
+    return session.query(Tag.id).filter(Tag.name == name).scalar()
+
+def _tagTerm(session, tagname):
+    tag_id = _tagId(session, tagname)
+    if tag_id is None: return Term(expr=sa.false(), estimate=0)
+    return Term.counted(session, article_tag_pairs.c.article_id, article_tag_pairs.c.tag_id == tag_id)
+
+def _authorTerm(session, author_condition):
+    author_ids = sa.select([Author.id]).where(author_condition)
+    return Term.counted(session, author_article_pairs.c.article_id,
+        author_article_pairs.c.author_id.in_(author_ids))
+
+def _journalTerm(journal_condition):
+    return _journalIdTerm(JournalIssue.journal_id.in_(
+        sa.select([Journal.id]).where(journal_condition)))
+
+def _journalIdTerm(journal_id_condition):
+    issue_ids = sa.select([JournalIssue.id]).where(journal_id_condition)
+    return Term(expr=Article.j_issue_id.in_(issue_ids))
+
+def _yearRange(text):
+    """'2001' or '2001-2005' to (first, last) years"""
+    (first, dash, last) = text.partition('-')
+    try:
+        return (int(first), int(last or first))
+    except ValueError:
+        raise ValueError('bad year: ' + text)
+
+def articleQuery(text, session=None):
+    """understands tag:, author:, authorexact:, journal:, journalexact:, journalid:,
+    issueid:, id: and free text"""
+    session = session or pdfrog.session
+    terms = []
+    text_terms = []
+    for keyword in keywords(text):
+        if keyword[0:4] == "tag:":
+            terms.append(_tagTerm(session, keyword[4:]))
+        elif keyword[0:7] == "author:":
+            terms.append(_authorTerm(session, Author.name.like('%' + keyword[7:] + '%')))
+        elif keyword[0:12] == "authorexact:":
+            terms.append(_authorTerm(session, Author.name == keyword[12:]))
+        elif keyword[0:8] == "journal:":
+            terms.append(_journalTerm(Journal.title.like('%' + keyword[8:] + '%')))
+        elif keyword[0:13] == "journalexact:":
+            terms.append(_journalTerm(Journal.title == keyword[13:]))
+        elif keyword[0:10] == "journalid:":
+            terms.append(_journalIdTerm(JournalIssue.journal_id == int(keyword[10:])))
+        elif keyword[0:8] == "issueid:":
+            terms.append(Term(expr=(Article.j_issue_id == int(keyword[8:]))))
+        elif keyword[0:3] == "id:":
+            terms.append(Term(expr=(Article.id == int(keyword[3:]))))
+        else:
+            text_terms.append(keyword)
+    query = compileTerms(session.query(Article), Article.id, terms)
+    if len(text_terms) > 0:
+        query = fulltext.filterArticles(query, text_terms)
+    return query
+
+def authorQuery(text, session=None):
+    """understands org:, orgexact:, tag: and parts of name"""
+    session = session or pdfrog.session
+    terms = []
+    for keyword in keywords(text):
+        if keyword[0:4] == "org:":
+            terms.append(Term(expr=Author.organization.like("%{}%".format(keyword[4:]))))
+        elif keyword[0:9] == "orgexact:":
+            terms.append(Term(expr=(Author.organization == keyword[9:])))
+        elif keyword[0:4] == "tag:":
+            tag_id = _tagId(session, keyword[4:])
+            if tag_id is None:
+                terms.append(Term(expr=sa.false(), estimate=0))
+                continue
+            terms.append(Term.counted(session, author_article_tags.c.author_id,
+                author_article_tags.c.tag_id == tag_id))
+        else:
+            terms.append(Term(expr=Author.name.like("%{}%".format(keyword))))
+    return compileTerms(session.query(Author), Author.id, terms)
+
+def journalQuery(text, session=None):
+    """understands year: (like year:2001 or year:2001-2005) and parts of title"""
+    session = session or pdfrog.session
+    query = session.query(Journal)
+    for keyword in keywords(text):
+        if keyword[0:5] == "year:":
+            (first, last) = _yearRange(keyword[5:])
+            query = query.filter(Journal.id.in_(sa.select([JournalIssue.journal_id]).\
+                where(JournalIssue.year.between(first, last))))
+        else:
+            query = query.filter(Journal.title.like("%{}%".format(keyword)))
+    return query
+
+def issueQuery(text, session=None):
+    """understands journalid:, year: and parts of journal title"""
+    session = session or pdfrog.session
+    query = session.query(JournalIssue)
+    for keyword in keywords(text):
+        if keyword[0:10] == "journalid:":
+            query = query.filter(JournalIssue.journal_id == int(keyword[10:]))
+        elif keyword[0:5] == "year:":
+            (first, last) = _yearRange(keyword[5:])
+            query = query.filter(JournalIssue.year.between(first, last))
+        else:
+            query = query.filter(JournalIssue.journal_id.in_(sa.select([Journal.id]).\
+                where(Journal.title.like("%{}%".format(keyword)))))
+    return query.order_by(JournalIssue.year)
+
+def tagQuery(text, session=None):
+    session = session or pdfrog.session
+    query = session.query(Tag)
+    for keyword in keywords(text):
+        query = query.filter(Tag.name.like("%{}%".format(keyword)))
+    return query
+
+
+_library_tables = {}    # schema name: {table name: table in that schema}
+
+def _libraryTables(schema):
+    if schema not in _library_tables:
+        metadata = sa.MetaData()
+        _library_tables[schema] = dict((table.name, table.tometadata(metadata, schema=schema))
+            for table in (Article.__table__, Author.__table__, Tag.__table__,
+                author_article_pairs, article_tag_pairs, fulltext.articles_fts))
+    return _library_tables[schema]
+
+def _libraryArticles(session, schema, tag_names, author_parts, text_terms):
+    """SELECT of (library, id, title) for articles of one library"""
+    t = _libraryTables(schema)
+    articles = t['articles']
+    select = sa.select([sa.literal(schema).label('library'), articles.c.id, articles.c.title])
+    tag_pairs = t['article_tag_pairs']
+    for name in tag_names:
+        select = select.where(articles.c.id.in_(sa.select([tag_pairs.c.article_id]).\
+            where(tag_pairs.c.tag_id.in_(sa.select([t['article_tags'].c.id]).\
+                where(t['article_tags'].c.name == name)))))
+    author_pairs = t['author_article_pairs']
+    for part in author_parts:
+        select = select.where(articles.c.id.in_(sa.select([author_pairs.c.article_id]).\
+            where(author_pairs.c.author_id.in_(sa.select([t['authors'].c.id]).\
+                where(t['authors'].c.name.like('%' + part + '%'))))))
+    if len(text_terms) > 0:
+        expr = fulltext.matchExpression(text_terms)
+        if not fulltext.available(session, schema):
+            for term in text_terms:
+                likestr = '%' + term.rstrip('*') + '%'
+                select = select.where(sa.or_(articles.c.title.like(likestr),
+                    articles.c.keywords.like(likestr)))
+        elif expr != '':
+            fts = t['articles_fts']
+            select = select.where(articles.c.id.in_(sa.select([fts.c.rowid]).\
+                where(sa.literal_column('articles_fts').op('MATCH')(expr))))
+    return select
+
+def libraryArticleQuery(text, libraries, session=None):
+    """searches articles of several libraries in one query
+
+    libraries are schema names: 'main' for opened database and names
+    given by database.attach(). Understands tag:, author: and free text.
+    Query yields (library, id, title) rows ordered by title."""
+    session = session or pdfrog.session
+    tag_names = []
+    author_parts = []
+    text_terms = []
+    for keyword in keywords(text):
+        if keyword[0:4] == "tag:":
+            tag_names.append(keyword[4:])
+        elif keyword[0:7] == "author:":
+            author_parts.append(keyword[7:])
+        else:
+            text_terms.append(keyword)
+    found = sa.union_all(*[_libraryArticles(session, schema, tag_names, author_parts, text_terms)
+        for schema in libraries]).alias('found')
+    return session.query(found.c.library, found.c.id, found.c.title).\
+        order_by(found.c.title, found.c.library, found.c.id)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/storage.py
+# How database file is accessed. Profile is a set of sqlite PRAGMAs applied
+# to every new connection, chosen by [storage] profile setting:
+#   compatible  rollback journal, full fsync on every commit (old behaviour)
+#   wal         write-ahead log: readers don't wait for writers, commits
+#               fsync only at checkpoints; large page cache and mmap reads
+#   fast        like wal, but no fsync at all; database survives crash of
+#               pdfrog, not of OS or power loss
+# BackgroundWriter runs writes on its own connection, commits them in
+# batches and checkpoints WAL when it's idle enough.
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import os
+import shutil
+import tempfile
+import threading
+import time
+import sqlalchemy as sa
+import sqlalchemy.orm
+from pdfrog import config
+
+PROFILES = {
+    'compatible': [
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+        ('busy_timeout', 5000),
+    ],
+    'wal': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -64 * 1024),             # KiB
+        ('mmap_size', 256 * 1024 * 1024),
+        ('busy_timeout', 5000),
+    ],
+    'fast': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'OFF'),
+        ('cache_size', -256 * 1024),
+        ('mmap_size', 1024 * 1024 * 1024),
+        ('temp_store', 'MEMORY'),
+        ('busy_timeout', 5000),
+    ],
+}
+
+def configure(engine, profile=None):
+    """makes every connection of engine use profile, [storage] profile by default"""
+    profile = profile or config.get('storage', 'profile')
+    if profile not in PROFILES:
+        raise Exception('unknown storage profile: {0}'.format(profile))
+    pragmas = PROFILES[profile]
+
+    @sa.event.listens_for(engine, 'connect')
+    def setPragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for (name, value) in pragmas:
+            cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+        cursor.close()
+    return profile
+
+def checkpoint(engine):
+    """moves WAL contents into database file without blocking anyone
+
+    Returns (busy, WAL pages, pages moved); (0, -1, -1) if not in WAL mode."""
+    conn = engine.connect()
+    try:
+        return tuple(conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone())
+    finally:
+        conn.close()
+
+
+class BackgroundWriter(threading.Thread):
+    """applies write jobs on its own connection, committing them in batches
+
+    Job is function(session). Jobs done are committed together once
+    batch_size of them are collected or commit_interval seconds passed
+    since first of them. After commit WAL is checkpointed if
+    checkpoint_interval seconds passed since last checkpoint. If commit
+    fails, e.g. database stays locked longer than busy_timeout, batch is
+    rolled back and its jobs run again, so jobs should be safe to repeat.
+    Jobs that fail, and batches still not committed after RETRIES tries,
+    are dropped; report_failure(number of jobs, error message), if given,
+    is then called on writer thread."""
+    RETRIES = 5
+
+    def __init__(self, engine, batch_size=None, commit_interval=None, checkpoint_interval=None,
+            report_failure=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.engine = engine
+        self.report_failure = report_failure
+        self.batch_size = batch_size or config.getint('storage', 'writer_batch_size')
+        self.commit_interval = commit_interval or float(config.get('storage', 'commit_interval'))
+        self.checkpoint_interval = checkpoint_interval or \
+            float(config.get('storage', 'checkpoint_interval'))
+        self.jobs = queue.Queue()
+        self.commits = 0
+        self.checkpoints = 0
+        self.failed = 0         # jobs given up on
+        self.error = None       # last error message
+
+    def submit(self, job):
+        self.jobs.put(job)
+
+    def close(self):
+        """commits everything submitted so far and stops thread"""
+        self.jobs.put(None)
+        self.join()
+
+    def run(self):
+        session = sa.orm.Session(bind=self.engine)
+        batch = []              # jobs done, but not committed yet
+        started = None          # when first job of batch was done
+        last_checkpoint = time.time()
+        closing = False
+        try:
+            while batch or not closing:
+                job = None
+                if not closing:
+                    wait = None if started is None else \
+                        max(0, started + self.commit_interval - time.time())
+                    try:
+                        job = self.jobs.get(timeout=wait)
+                        closing = job is None
+                    except queue.Empty:
+                        pass
+                if job is not None:
+                    batch = self.runJob(session, job, batch)
+                    started = (started or time.time()) if batch else None
+                if batch and (closing or len(batch) >= self.batch_size or \
+                        time.time() >= started + self.commit_interval):
+                    self.commit(session, batch)
+                    batch = []
+                    started = None
+                    if time.time() - last_checkpoint >= self.checkpoint_interval:
+                        checkpoint(self.engine)
+                        self.checkpoints += 1
+                        last_checkpoint = time.time()
+        finally:
+            session.close()
+
+    def runJob(self, session, job, batch):
+        """runs job; if it fails, its changes are dropped and batch is redone
+
+        Returns jobs done and not committed yet."""
+        try:
+            job(session)
+            return batch + [job]
+        except Exception as e:
+            self.giveUp([job], e)
+            return self.replay(session, batch)
+
+    def replay(self, session, batch):
+        """rolls back and runs batch again; jobs failing now are given up
+
+        Returns jobs done."""
+        while True:
+            session.rollback()
+            for (i, job) in enumerate(batch):
+                try:
+                    job(session)
+                except Exception as e:
+                    self.giveUp([job], e)
+                    batch = batch[:i] + batch[i + 1:]
+                    break
+            else:
+                return batch
+
+    def commit(self, session, batch):
+        for attempt in range(self.RETRIES):
+            try:
+                session.commit()
+                self.commits += 1
+                return
+            except Exception as e:
+                error = e
+                session.rollback()
+                time.sleep(0.1 * (attempt + 1))
+                batch = self.replay(session, batch)
+                if not batch: return
+        session.rollback()
+        self.giveUp(batch, error)
+
+    def giveUp(self, jobs, error):
+        self.failed += len(jobs)
+        self.error = str(error)
+        if self.report_failure is not None:
+            self.report_failure(len(jobs), self.error)
+
+
+def benchmark(profile, rows=2000):
+    """times typical work on a scratch database using profile
+
+    Returns list of (what, seconds)."""
+    directory = tempfile.mkdtemp(prefix='pdfrog-bench-')
+    try:
+        engine = sa.create_engine('sqlite:///' + os.path.join(directory, 'bench.db'))
+        configure(engine, profile)
+        metadata = sa.MetaData()
+        table = sa.Table('bench', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String, index=True),
+            sa.Column('data', sa.Binary))
+        metadata.create_all(engine)
+        payload = os.urandom(16 * 1024)
+        results = []
+
+        started = time.time()
+        for i in range(rows // 10):
+            with engine.begin() as conn:
+                conn.execute(table.insert(), name='small{0}'.format(i), data=payload)
+        results.append(('{0} small commits'.format(rows // 10), time.time() - started))
+
+        started = time.time()
+        with engine.begin() as conn:
+            conn.execute(table.insert(),
+                [dict(name='bulk{0}'.format(i), data=payload) for i in range(rows)])
+        results.append(('{0} rows in one commit'.format(rows), time.time() - started))
+
+        started = time.time()
+        with engine.connect() as conn:
+            for i in range(rows):
+                conn.execute(sa.select([table.c.id]).where(table.c.name == 'bulk{0}'.format(i))).fetchall()
+        results.append(('{0} indexed reads'.format(rows), time.time() - started))
+
+        # reader while another connection holds a write transaction open;
+        # it's big enough to spill out of default page cache
+        def write():
+            with engine.begin() as conn:
+                conn.execute(table.insert(), [dict(name='late', data=payload)] * 1000)
+                time.sleep(0.5)
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.3)
+        started = time.time()
+        with engine.connect() as conn:
+            conn.execute(sa.select([sa.func.count()]).select_from(table)).scalar()
+        results.append(('read during open write', time.time() - started))
+        writer.join()
+
+        started = time.time()
+        checkpoint(engine)
+        results.append(('checkpoint', time.time() - started))
+        engine.dispose()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -4,6 +4,7 @@ from PySide.QtGui import *
 from PySide.QtCore import *
 import pdfrog
 from .datamodel import Tag
+from .pagedmodel import PagedQueryModel
 import sqlalchemy as sa
 
 class TagList(QTableView):
@@ -15,10 +16,11 @@ class TagList(QTableView):
         self.horizontalHeader().setHighlightSections(False)
         self.installEventFilter(self)
         self.verticalHeader().setVisible(False)
+        # no column is sorted until user clicks its header
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.setSortingEnabled(True)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.query = None
-        self.refreshData()
 
     def createMenu(self, tag_menu):
         tag_remove_action = QAction(QIcon.fromTheme("edit-delete"), "Remove", self)
@@ -27,6 +29,9 @@ class TagList(QTableView):
         tag_rename_action = QAction(QIcon.fromTheme("document-edit"), "Rename", self)
         tag_rename_action.triggered.connect(self.renameSelectedTag)
 
+        tag_merge_action = QAction("Merge into ...", self)
+        tag_merge_action.triggered.connect(self.mergeSelectedTags)
+
         tag_discharge_action = QAction(QIcon.fromTheme("document-decrypt"), "Discharge", self)
         tag_discharge_action.triggered.connect(self.dischargeSelectedTags)
 
@@ -37,18 +42,21 @@ class TagList(QTableView):
         tag_menu.addAction(tag_refresh_list_action)
         tag_menu.addAction(tag_remove_action)
         tag_menu.addAction(tag_rename_action)
+        tag_menu.addAction(tag_merge_action)
         tag_menu.addAction(tag_discharge_action)
 
-    def refreshData(self, query=None):
+    def refreshData(self, query=None, total=None, first_page=None):
         if query is None:
-            query = self.query or pdfrog.session.query(Tag).limit(300)
+            query = self.query or pdfrog.session.query(Tag)
         self.query = query
+        # model drops sort keys, results come in query's own order
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        return self.model().setQuery(query, total, first_page)
+
+    def clearData(self):
+        """forgets query and shown rows, e.g. when another library is opened"""
+        self.query = None
         self.model().clearData()
-        item_count = 0
-        for tag in query:
-            self.model().appendTag(tag)
-            item_count += 1
-        return item_count
 
     def removeSelectedTags(self):
         idxs = self.selectionModel().selectedRows()
@@ -76,10 +84,28 @@ class TagList(QTableView):
         if len(idxs) > 0:
             tag = self.item(idxs[0].row())
             (new_tag_name, ok_pressed) = QInputDialog.getText(self, "Rename tag", "New name:", text=tag.name)
-            if ok_pressed and new_tag_name != "":
-                tag.name = new_tag_name
+            if ok_pressed and new_tag_name != "" and new_tag_name != tag.name:
+                if Tag.byName(new_tag_name) is not None:
+                    res = QMessageBox.question(self, "Rename tag",
+                        "Tag {} already exists. Merge {} into it?".format(new_tag_name, tag.name),
+                        buttons = QMessageBox.Ok | QMessageBox.Cancel)
+                    if res != QMessageBox.Ok: return
+                tag.rename(new_tag_name)
                 self.refreshData()
 
+    def mergeSelectedTags(self):
+        """moves all uses of selected tags to one tag. Asks user for its name"""
+        idxs = self.selectionModel().selectedRows()
+        if len(idxs) == 0: return
+        tags = [self.item(idx.row()) for idx in idxs]
+        (target_name, ok_pressed) = QInputDialog.getText(self, "Merge tags", "Merge into tag:",
+            text=tags[0].name)
+        if ok_pressed and target_name != "":
+            target = Tag.byName(target_name, create=True)
+            for tag in tags:
+                tag.mergeInto(target)
+            self.refreshData()
+
     def dischargeSelectedTags(self):
         """removes any use of the selected tags"""
         idxs = self.selectionModel().selectedRows()
@@ -110,18 +136,14 @@ class TagList(QTableView):
         return self.model().item(row)
 
 
-class TagListModel(QAbstractTableModel):
-    def __init__(self, parent=None, *args):
-        QAbstractTableModel.__init__(self, parent, *args)
+class TagListModel(PagedQueryModel):
+    def __init__(self, parent=None):
+        PagedQueryModel.__init__(self, Tag.id, parent)
         self.view = parent
-        self.datastore = []
 
     COLUMN_TAG = 0
     COLUMN_TIMES_USED = 1
 
-    def rowCount(self, parent=None):
-        return len(self.datastore)
-
     def columnCount(self, parent=None):
         return 2
 
@@ -129,10 +151,12 @@ class TagListModel(QAbstractTableModel):
         if not index.isValid():
             return None
         elif role == Qt.DisplayRole:
+            tag = self.shownItem(index.row())
+            if tag is None: return None
             if index.column() == self.COLUMN_TAG:
-                return self.datastore[index.row()].name
+                return tag.name
             if index.column() == self.COLUMN_TIMES_USED:
-                return self.datastore[index.row()].getUsageCount()
+                return tag.getUsageCount()
             else:
                 return "Unknown"
         else:
@@ -149,27 +173,10 @@ class TagListModel(QAbstractTableModel):
         else:
             return None
 
-    def clearData(self):
-        self.modelReset.emit()
-        self.datastore = []
-
-    def appendTag(self, tag, update=True):
-        if type(tag) != Tag:
-            raise Exception("tag is not Tag")
-        if update: self.beginInsertRows(QModelIndex(), len(self.datastore), len(self.datastore))
-        self.datastore.append(tag)
-        if update: self.endInsertRows()
-
     def sort(self, column, order):
-        reverse = (order == Qt.DescendingOrder)
-        self.layoutAboutToBeChanged.emit()
-
-        if column == self.COLUMN_TAG:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.name, reverse=reverse)
-        elif column == self.COLUMN_TIMES_USED:
-            self.datastore = sorted(self.datastore, key=lambda obj: obj.getUsageCount(), reverse=reverse)
-
-        self.layoutChanged.emit()
-
-    def item(self, row):
-        return self.datastore[row]
+        columns = {
+            self.COLUMN_TAG: Tag.name,
+            self.COLUMN_TIMES_USED: Tag.usage_count,
+        }
+        if column in columns:
+            self.sortQuery([(columns[column], order == Qt.DescendingOrder)])
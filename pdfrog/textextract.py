@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/textextract.py
+# Fills Article.plaintext from stored files. Files are handed to external
+# tools in a process pool; results come back in batches, ready to be written
+# in one transaction each. Article.textstatus records the outcome, so
+# articles already processed are skipped when extraction is run again.
+# When a tool can't be run at all (not installed), status stays NULL and
+# the article is tried again next time; retryFailed() makes articles whose
+# tool did run but failed pending again.
+import sqlalchemy as sa
+import multiprocessing
+import subprocess
+import tempfile
+import shutil
+import os
+from pdfrog.datamodel import Article, FileBlob
+from pdfrog import config
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_UNSUPPORTED = 'unsupported'
+
+def _runTool(args):
+    with open(os.devnull, 'w') as fnull:
+        out = subprocess.check_output(args, stderr=fnull)
+    return out.decode('utf-8', 'replace')
+
+def extractPdf(path):
+    return _runTool(['pdftotext', '-enc', 'UTF-8', path, '-'])
+
+def extractPostscript(path):
+    return _runTool(['ps2ascii', path])
+
+def extractPlainText(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', 'replace')
+
+# mime type -> function taking file path and returning text. Functions must
+# be defined at module level, they are run in worker processes.
+extractors = {}
+
+def registerExtractor(mime, func):
+    extractors[mime] = func
+
+registerExtractor('application/pdf', extractPdf)
+registerExtractor('application/postscript', extractPostscript)
+registerExtractor('text/plain', extractPlainText)
+
+def _extract(job):
+    (article_id, mime, path) = job
+    try:
+        return (article_id, STATUS_DONE, extractors[mime](path))
+    except OSError:
+        # tool is missing or not runnable, that's not this file's fault
+        return (article_id, None, None)
+    except Exception:
+        return (article_id, STATUS_FAILED, None)
+    finally:
+        os.remove(path)
+
+
+class TextExtraction(object):
+    """extracts text of articles which don't have textstatus yet
+
+    session is used only for reading, results are yielded by batches() and
+    should be written with storeResults()."""
+    def __init__(self, session, processes=None, batch_size=None):
+        self.session = session
+        self.processes = processes or config.getint('extract', 'processes') or None
+        self.batch_size = batch_size or config.getint('extract', 'batch_size')
+        self.stop_requested = False
+
+    def pendingCount(self):
+        return self.session.query(Article.id).\
+            filter(Article.textstatus == None, Article.blob_id != None).count()
+
+    def batches(self):
+        """yields lists of (article_id, status, text) tuples"""
+        pool = multiprocessing.Pool(self.processes)
+        tmpdir = tempfile.mkdtemp('', 'pdfrog_extract_')
+        last_id = -1
+        try:
+            while not self.stop_requested:
+                rows = self.session.query(Article.id, Article.filemime, Article.blob_id).\
+                    filter(Article.textstatus == None, Article.blob_id != None).\
+                    filter(Article.id > last_id).order_by(Article.id).\
+                    limit(self.batch_size).all()
+                if len(rows) == 0: break
+                last_id = rows[-1][0]
+                results = []
+                jobs = []
+                for (article_id, mime, blob_id) in rows:
+                    if mime not in extractors:
+                        results.append((article_id, STATUS_UNSUPPORTED, None))
+                        continue
+                    path = os.path.join(tmpdir, str(article_id))
+                    with open(path, 'wb') as f:
+                        self.session.query(FileBlob).get(blob_id).writeTo(f)
+                    jobs.append((article_id, mime, path))
+                results += pool.map(_extract, jobs)
+                self.session.expunge_all()
+                yield results
+        finally:
+            pool.terminate()
+            pool.join()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def stop(self):
+        """makes batches() finish after current batch"""
+        self.stop_requested = True
+
+
+def retryFailed(session):
+    """makes failed articles pending again, returns their count"""
+    return session.execute(Article.__table__.update().\
+        where(Article.textstatus == STATUS_FAILED).values(textstatus=None)).rowcount
+
+def storeResults(session, results):
+    """writes batch of results with one UPDATE statement"""
+    if len(results) == 0: return
+    stmt = Article.__table__.update().\
+        where(Article.id == sa.bindparam('b_id')).\
+        values(plaintext=sa.bindparam('b_text'), textstatus=sa.bindparam('b_status'))
+    session.execute(stmt, [dict(b_id=article_id, b_status=status, b_text=text) \
+        for (article_id, status, text) in results])
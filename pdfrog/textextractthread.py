@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# file: pdfrog/textextractthread.py
+from PySide.QtCore import *
+from pdfrog import database
+from pdfrog.textextract import TextExtraction
+
+class TextExtractThread(QThread):
+    """runs TextExtraction with its own session, hands batches to GUI thread"""
+    batchReady = Signal(object)
+
+    def __init__(self, parent=None):
+        QThread.__init__(self, parent)
+        self.extraction = None
+
+    def run(self):
+        with database.unitOfWork() as session:
+            self.extraction = TextExtraction(session)
+            for results in self.extraction.batches():
+                self.batchReady.emit(results)
+
+    def stop(self):
+        if self.extraction is not None:
+            self.extraction.stop()